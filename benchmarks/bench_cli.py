@@ -0,0 +1,34 @@
+"""Cold start time of `mara --help` (in a new process, without a warm server)
+
+Run with `python benchmarks/bench_cli.py`.
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+
+def cold_start(repeat: int = 5) -> float:
+    """The best wall time of `mara --help` in milliseconds"""
+    environment = dict(os.environ, MARA_NO_SERVER='1')
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'from mara_base.server import main; main()', '--help'],
+                       env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        durations.append(time.perf_counter() - start)
+    return min(durations) * 1000
+
+
+def run() -> {str: float}:
+    return {'mara --help [ms]': cold_start()}
+
+
+def main():
+    for name, value in run().items():
+        print(f'{name:<50} {value:10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Throughput of `replace()` and of loading 10k environment variables
+
+Run with `python benchmarks/bench_config.py`.
+"""
+
+import os
+import time
+import timeit
+
+from mara_base.config_system import replaceable, replace, add_config_from_environment, _reset_config
+
+NUMBER = 10_000
+
+
+def replace_throughput() -> float:
+    """Nanoseconds per `replace()` of a declared function"""
+    replaceable('benchmarks.replaced')(lambda: 1)
+    replacements = [lambda: 2, lambda: 3]
+    start = time.perf_counter_ns()
+    for i in range(NUMBER):
+        replace('benchmarks.replaced', function=replacements[i % 2])
+    duration = time.perf_counter_ns() - start
+    _reset_config()
+    return duration / NUMBER
+
+
+def environment_loading(variables: int = 10_000) -> float:
+    """Milliseconds for `add_config_from_environment` with `variables` config variables in the environment"""
+    names = [f'MARA_BENCHMARKS__VALUE_{i}' for i in range(variables)]
+    for i, name in enumerate(names):
+        os.environ[name] = str(i)
+    try:
+        return min(timeit.repeat(add_config_from_environment, number=1, repeat=3)) * 1000
+    finally:
+        for name in names:
+            del os.environ[name]
+        _reset_config()
+
+
+def run() -> {str: float}:
+    return {'replace() [ns]': replace_throughput(),
+            'add_config_from_environment, 10k variables [ms]': environment_loading()}
+
+
+def main():
+    for name, value in run().items():
+        print(f'{name:<50} {value:10.1f}')
+
+
+if __name__ == '__main__':
+    import logging
+
+    # replacing the same function over and over again warns each time
+    logging.disable(logging.WARNING)
+    main()
@@ -0,0 +1,68 @@
+"""Per-call overhead of stacks of 1 to 10 `monkey_patch.wrap`s
+
+Compares the composed wrap stack with the nested wrappers that `wrap` created before (one extra frame and one
+`*args/**kwargs` repack per wrap). Run with `python benchmarks/bench_monkey_patch.py`.
+"""
+
+import functools
+import sys
+import timeit
+import types
+
+from mara_base import monkey_patch
+
+NUMBER = 200_000
+
+
+def _module() -> types.ModuleType:
+    module = types.ModuleType('benchmarked_module')
+    exec('def function(x):\n    return x\n', module.__dict__)
+    sys.modules[module.__name__] = module
+    return module
+
+
+def passing_wrap(original_function, x):
+    return original_function(x)
+
+
+def nested_wrappers(function, depth: int):
+    """The wrap chain as built by the former implementation of `wrap`"""
+
+    def wrap(original_function):
+        def wrapper(*args, **kwargs):
+            return passing_wrap(original_function, *args, **kwargs)
+
+        return functools.update_wrapper(wrapper, original_function)
+
+    for _ in range(depth):
+        function = wrap(function)
+    return function
+
+
+def measure(func, number: int = NUMBER) -> float:
+    """Returns the best time of a single call in nanoseconds"""
+    return min(timeit.repeat(lambda: func(1), number=number, repeat=5)) / number * 1e9
+
+
+def run() -> {str: float}:
+    """Returns the per-call overhead in nanoseconds by benchmark name"""
+    module = _module()
+    direct = measure(module.function)
+    results = {}
+    for depth in range(1, 11):
+        nested = nested_wrappers(module.function, depth)
+        for _ in range(depth):
+            monkey_patch.wrap(module.function)(passing_wrap)
+        results[f'wrap stack of {depth}'] = measure(module.function) - direct
+        results[f'nested wrappers of {depth}'] = measure(nested) - direct
+        monkey_patch.unwrap(module.function)
+    return results
+
+
+def main():
+    for name, overhead in run().items():
+        print(f'{name:<25} +{overhead:8.1f} ns')
+
+
+if __name__ == '__main__':
+    main()
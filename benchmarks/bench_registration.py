@@ -0,0 +1,68 @@
+"""`register_all_in_module` and `get_flattend_configuration` with 1,000 synthetic modules
+
+Run with `python benchmarks/bench_registration.py`.
+"""
+
+import collections
+import time
+import types
+
+import mara_base
+
+
+def synthetic_modules(count: int = 1000) -> [types.ModuleType]:
+    modules = []
+    for i in range(count):
+        module = types.ModuleType(f'synthetic_{i}')
+
+        def MARA_THINGS(i=i):
+            yield from range(i, i + 3)
+
+        module.MARA_THINGS = MARA_THINGS
+        module.MARA_LIST = [i]
+        modules.append(module)
+    return modules
+
+
+def run() -> {str: float}:
+    """Milliseconds by benchmark name"""
+    saved = (mara_base._mara_configuration, mara_base._registered_modules, mara_base._registered_items,
+             mara_base._materialized)
+    mara_base._mara_configuration = collections.defaultdict(list)
+    mara_base._registered_modules = {}
+    mara_base._registered_items = set()
+    mara_base._materialized = {}
+    try:
+        modules = synthetic_modules()
+        results = {}
+        start = time.perf_counter()
+        for module in modules:
+            mara_base.register_all_in_module(module)
+        results['register_all_in_module, 1000 modules [ms]'] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        for module in modules:
+            mara_base.register_all_in_module(module)
+        results['register_all_in_module again, 1000 modules [ms]'] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        assert 3000 == len(mara_base.get_flattend_configuration('MARA_THINGS'))
+        results['get_flattend_configuration, first call [ms]'] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        for _ in range(100):
+            mara_base.get_flattend_configuration('MARA_THINGS')
+        results['get_flattend_configuration, cached [ms]'] = (time.perf_counter() - start) * 1000 / 100
+        return results
+    finally:
+        (mara_base._mara_configuration, mara_base._registered_modules, mara_base._registered_items,
+         mara_base._materialized) = saved
+
+
+def main():
+    for name, value in run().items():
+        print(f'{name:<50} {value:10.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Call overhead of @replaceable functions compared with calling the original function directly
+
+Run with `python benchmarks/bench_replaceable.py`.
+"""
+
+import timeit
+
+from mara_base.config_system import replaceable, replace
+
+NUMBER = 1_000_000
+
+
+def original(argument: str = None) -> str:
+    return 'x'
+
+
+def replacement(argument: str = None) -> str:
+    return 'y'
+
+
+def replacement_with_original(argument: str = None, original_function=None) -> str:
+    return original_function(argument)
+
+
+unreplaced = replaceable('benchmarks.unreplaced')(original)
+replaced = replaceable('benchmarks.replaced')(original)
+replace('benchmarks.replaced', function=replacement)
+replaced_with_original = replaceable('benchmarks.replaced_with_original')(original)
+replace('benchmarks.replaced_with_original', include_original_function=True, function=replacement_with_original)
+
+
+def measure(func, number: int = NUMBER) -> float:
+    """Returns the best time of a single call in nanoseconds"""
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e9
+
+
+def run() -> {str: float}:
+    """Returns the per-call overhead over calling the function directly in nanoseconds by benchmark name"""
+    results = {}
+    for label, func, reference in [('unreplaced', unreplaced, original),
+                                   ('replaced', replaced, replacement),
+                                   ('replaced, include_original_function', replaced_with_original,
+                                    lambda: replacement_with_original(original_function=original))]:
+        results[label] = measure(func) - measure(reference)
+    return results
+
+
+def main():
+    print(f'{"direct call":<35} {measure(original):8.1f} ns')
+    for label, overhead in run().items():
+        print(f'{label:<35} +{overhead:7.1f} ns over direct call')
@@ -0,0 +1,84 @@
+"""
+Runs all benchmarks and stores the results as json, so they can be compared across commits
+
+    python benchmarks/run.py --output bench-$(git rev-parse --short HEAD).json
+    python benchmarks/run.py --compare bench-abc1234.json
+
+All results are durations (lower is better). With `--compare`, results which are more than `--threshold`
+slower than in the given file are reported as regressions and the exit code is 1.
+"""
+
+import argparse
+import json
+import logging
+import platform
+import subprocess
+import sys
+import time
+
+import bench_cli
+import bench_config
+import bench_monkey_patch
+import bench_registration
+import bench_replaceable
+
+BENCHMARKS = {'replaceable call overhead [ns]': bench_replaceable,
+              'config': bench_config,
+              'registration': bench_registration,
+              'monkey_patch.wrap overhead [ns]': bench_monkey_patch,
+              'cli': bench_cli}
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run() -> dict:
+    results = {}
+    for group, module in BENCHMARKS.items():
+        for name, value in module.run().items():
+            results[name if group in ('config', 'registration', 'cli') else f'{group}: {name}'] = value
+    return {'commit': _commit(), 'python': platform.python_version(), 'timestamp': time.time(),
+            'results': results}
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> [str]:
+    """Prints the results next to `baseline`, returns the names of regressed benchmarks"""
+    regressions = []
+    max_len = max(len(name) for name in current['results'])
+    for name, value in current['results'].items():
+        before = baseline['results'].get(name)
+        change = '' if not before else f'{(value - before) / before * 100:+7.1f} %'
+        if before and value > before * (1 + threshold):
+            regressions.append(name)
+            change += '  REGRESSION'
+        print(f'{name:<{max_len}} {before if before is not None else float("nan"):12.3f} {value:12.3f} {change}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help='Where to write the results as json')
+    parser.add_argument('--compare', help='Results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Relative slowdown reported as regression')
+    args = parser.parse_args()
+
+    # replacing the same config over and over again warns each time
+    logging.disable(logging.WARNING)
+    current = run()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), current, args.threshold)
+        sys.exit(1 if regressions else 0)
+    for name, value in current['results'].items():
+        print(f'{name:<70} {value:12.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,17 @@
 import collections
+import contextlib
 import copy
+import functools
+import importlib
+import importlib.abc
 import logging
 import sys
 import types
 import typing
 import itertools
 
+from . import startup_profiler
+
 log = logging.getLogger(__name__)
 
 
@@ -29,40 +35,245 @@ def MARA_NAVIGATION_ENTRY_FNS():
 # The main API functionality
 _mara_configuration: {str: list} = collections.defaultdict(list)
 
+_registered_modules: {int: types.ModuleType} = {}
+"""All modules passed to `register_all_in_module`, keyed by identity (the module is kept so the id stays unique)"""
+
+_registered_items: {(str, int, int)} = set()
+"""`MARA_*` name and identities of module and items of each entry in `_mara_configuration`"""
+
+
+_generation = 0
+"""Bumped whenever functionality is registered, invalidates the materialized contributions"""
+
+_materialized: {str: (int, list)} = {}
+"""The evaluated contributions per `MARA_*` name and the generation they were evaluated in"""
+
 
 def register_all_in_module(module: types.ModuleType):
-    """Registers all declared functionality"""
+    """Registers all declared functionality
+
+    Registering the same module again is a no-op.
+    """
+    if id(module) in _registered_modules:
+        return
+    _registered_modules[id(module)] = module
+    if _overlays:
+        _overlays[-1]['modules'].append(id(module))
     for attr in dir(module):
         if attr.startswith('MARA_'):
             items = getattr(module, attr)
             assert (callable(items) or isinstance(items, typing.Iterable))
-            _mara_configuration[attr].append((module, items))
+            _add_contribution(attr, module, items)
+
+
+_overlays: [dict] = []
+"""The undo journals of the active `overlay()` blocks, innermost last"""
+
+
+def _journal(name: str):
+    """Records the number of contributions to `name` before the first change in the innermost overlay"""
+    if _overlays:
+        _overlays[-1]['lengths'].setdefault(name, len(_mara_configuration[name]))
+
+
+@contextlib.contextmanager
+def overlay():
+    """Undoes all registrations of functionality within the block, e.g. in a test
+
+    Entering the block costs nothing, leaving it only touches the `MARA_*` names with new contributions.
+    """
+    global _generation
+    journal = {'lengths': {}, 'modules': [], 'entry_point_groups': []}
+    _overlays.append(journal)
+    try:
+        yield
+    finally:
+        assert _overlays[-1] is journal, 'Overlays are left in a different order than they were entered'
+        _overlays.pop()
+        for name, length in journal['lengths'].items():
+            for module, items in _mara_configuration[name][length:]:
+                _registered_items.discard((name, id(module), id(items)))
+            del _mara_configuration[name][length:]
+        for module_id in journal['modules']:
+            _registered_modules.pop(module_id, None)
+        _loaded_entry_point_groups.difference_update(journal['entry_point_groups'])
+        _generation += 1
+
+
+def _add_contribution(name: str, module: types.ModuleType, items):
+    """Registers `items` of `module` for `name`, unless they are already registered (e.g. via an entry point)"""
+    global _generation
+    key = (name, id(module), id(items))
+    if key in _registered_items:
+        return
+    _journal(name)
+    _mara_configuration[name].append((module, items))
+    _registered_items.add(key)
+    _generation += 1
+
+
+ENTRY_POINT_GROUP_PREFIX = 'mara.'
+"""Packages can declare contributions as entry points in the group `mara.<MARA_* name>`"""
+
+_entry_points: {str: [(str, str)]} = None
+"""Name and value of all entry points of groups starting with `ENTRY_POINT_GROUP_PREFIX` by group, read once"""
+
+_loaded_entry_point_groups: {str} = set()
+
+
+def _load_entry_points(name: str):
+    """Registers the contributions to `name` which packages declare in their metadata
+
+    Only the modules with the contributions to `name` are imported.
+    """
+    global _entry_points
+    group = ENTRY_POINT_GROUP_PREFIX + name
+    if group in _loaded_entry_point_groups:
+        return
+    _loaded_entry_point_groups.add(group)
+    if _overlays:
+        _overlays[-1]['entry_point_groups'].append(group)
+    if _entry_points is None:
+        from .module_discovery import find_entry_points
+        _entry_points = find_entry_points(ENTRY_POINT_GROUP_PREFIX)
+    for _, value in _entry_points.get(group, ()):
+        # `module:attribute [extras]`, resolved without importing importlib.metadata
+        module_name, _, attribute = value.partition('[')[0].partition(':')
+        try:
+            module = importlib.import_module(module_name.strip())
+            items = functools.reduce(getattr, attribute.strip().split('.'), module) if attribute.strip() else module
+        except Exception:
+            log.exception("Could not load the entry point '%s' of '%s'", value, group)
+            continue
+        _add_contribution(name, module, items)
+
+
+def dynamic(items: typing.Callable) -> typing.Callable:
+    """Marks a `MARA_*` generator whose items are re-evaluated on every `get_flattend_configuration` call
+
+    Example:
+    >>> @dynamic
+    ... def MARA_NAVIGATION_ENTRY_FNS():
+    ...     yield from entries_depending_on_the_current_user()
+    """
+    items.mara_dynamic = True
+    return items
+
+
+_compose_app_pending = False
+"""Whether the app composing function still has to be called before contributed functionality is consumed"""
+
 
+def _compose_app_on_first_use():
+    """Defers calling the app composing function until contributed functionality is consumed first"""
+    global _compose_app_pending
+    _compose_app_pending = True
 
-def get_flattend_configuration(name: str) -> typing.Iterable:
-    all_items = _mara_configuration[name]
-    for module, items in all_items:
-        if callable(items):
-            # a generator
-            yield from zip(itertools.repeat(module), items())
-        else:
-            # lists and so on
-            yield from zip(itertools.repeat(module), items)
+
+def _evaluate(name: str, module: types.ModuleType, items) -> tuple:
+    if startup_profiler.enabled:
+        items = startup_profiler.profiled_items(f'{name} {module.__name__}', items() if callable(items) else items,
+                                                module=module.__name__)
+    elif callable(items):
+        # a generator
+        items = items()
+    return tuple(zip(itertools.repeat(module), items))
+
+
+def get_flattend_configuration(name: str) -> typing.Sequence:
+    """Returns all contributed items for `name` as `(module, item)` tuples
+
+    The contributions are evaluated once and then returned from a cache until new functionality
+    is registered. Generators marked as `@dynamic` are evaluated on every call. Contributions
+    declared as entry points (see `ENTRY_POINT_GROUP_PREFIX`) are imported on the first call.
+    """
+    global _compose_app_pending
+    if _compose_app_pending:
+        _compose_app_pending = False
+        _call_app_composing_function()
+    _load_entry_points(name)
+    generation, segments = _materialized.get(name, (None, None))
+    if generation != _generation:
+        generation = _generation
+        segments = []
+        for module, items in _mara_configuration[name]:
+            if getattr(items, 'mara_dynamic', False):
+                segments.append(functools.partial(_evaluate, name, module, items))
+            else:
+                segments.append(_evaluate(name, module, items))
+        if not any(callable(segment) for segment in segments):
+            # the common case: a single tuple with all items
+            segments = [tuple(itertools.chain.from_iterable(segments))]
+        _materialized[name] = (generation, segments)
+    if len(segments) == 1 and not callable(segments[0]):
+        return segments[0]
+    return tuple(itertools.chain.from_iterable(segment() if callable(segment) else segment
+                                               for segment in segments))
 
 
 def register_all_imported_modules():
     for name, module in copy.copy(sys.modules).items():
-        register_all_in_module(module)
+        if module is not None:
+            register_all_in_module(module)
+
+
+class _RegisteringLoader(importlib.abc.Loader):
+    """Wraps the loader of a module to register the module once it finished importing"""
+
+    def __init__(self, loader):
+        self.loader = loader
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        # the module only ever sees its real loader
+        module.__spec__.loader = self.loader
+        module.__loader__ = self.loader
+        self.loader.exec_module(module)
+        if any(attr.startswith('MARA_') for attr in vars(module)):
+            register_all_in_module(module)
+
+
+class _RegisteringFinder(importlib.abc.MetaPathFinder):
+    """Finds modules with the other finders in `sys.meta_path` and wraps their loaders"""
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _RegisteringLoader(spec.loader)
+                return spec
+        return None
+
+
+_registering_finder = _RegisteringFinder()
+
+
+def register_modules_on_import():
+    """Registers all imported modules and from now on every module once it finished importing
+
+    Unlike repeated calls of `register_all_imported_modules`, each module is only checked once.
+    """
+    register_all_imported_modules()
+    if _registering_finder not in sys.meta_path:
+        sys.meta_path.insert(0, _registering_finder)
 
 def _call_app_composing_function():
     import importlib
     from .config import default_app_module
+    from .module_discovery import module_exists
     app_module_name = default_app_module()
-    try:
-        app = importlib.import_module(app_module_name)
-    except ModuleNotFoundError:
+    if not module_exists(app_module_name):
         log.error("MARA_DEFAULT_APP (%s) is not an importable module.", app_module_name)
         return
+    app = importlib.import_module(app_module_name)
     if not hasattr(app, 'compose_app'):
         log.error("MARA_DEFAULT_APP (%s) has no 'compose_app() function.", app_module_name)
         return
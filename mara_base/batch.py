@@ -0,0 +1,186 @@
+"""
+Running many `mara` commands in parallel, for `mara run-many`
+
+The app is composed once, then each command runs in a process which is forked from the composed app, at most
+`concurrency` at a time. A command only starts when the commands it depends on succeeded, commands which
+depend on a failed command are skipped. The output of each command goes to its own log file.
+
+Invocations are given one per line, optionally with a name and the names of the commands they depend on:
+
+    migrate: mara_db.migrate
+    load <- migrate: mara_pipelines.run --path load
+    report <- migrate, load: app.send-report
+    app.cleanup
+"""
+
+import logging
+import os
+import re
+import shlex
+import signal
+import sys
+import tempfile
+import time
+import typing
+
+log = logging.getLogger(__name__)
+
+
+class Invocation(typing.NamedTuple):
+    name: str
+    argv: [str]
+    dependencies: [str]
+
+
+class Result(typing.NamedTuple):
+    invocation: Invocation
+    exit_code: typing.Optional[int]
+    """None when the command was skipped"""
+    duration: float
+    log_file: typing.Optional[str]
+
+
+_NAME_PATTERN = re.compile(r'^\s*([\w.-]+)\s*(?:<-\s*([\w.\-,\s]*?))?\s*:\s+')
+
+
+def parse_invocations(lines: typing.Iterable[str]) -> [Invocation]:
+    """Parses `[name [<- dependency, ...]:] command args` lines, empty lines and `#` comments are ignored
+
+    Unnamed invocations are named by their position, starting with 1.
+    """
+    invocations = []
+    for line in lines:
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        match = _NAME_PATTERN.match(line)
+        name, dependencies = (match.group(1), match.group(2)) if match else (None, None)
+        argv = shlex.split(line[match.end():] if match else line)
+        if not argv:
+            raise ValueError(f'No command in "{line.strip()}"')
+        invocations.append(Invocation(name=name or str(len(invocations) + 1), argv=argv,
+                                      dependencies=[dependency.strip() for dependency in (dependencies or '').split(',')
+                                                    if dependency.strip()]))
+    _check_dependencies(invocations)
+    return invocations
+
+
+def _check_dependencies(invocations: [Invocation]):
+    """Raises a ValueError for duplicate names, unknown dependencies and cycles"""
+    names = [invocation.name for invocation in invocations]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f'Duplicate command names: {", ".join(duplicates)}')
+    for invocation in invocations:
+        unknown = [dependency for dependency in invocation.dependencies if dependency not in names]
+        if unknown:
+            raise ValueError(f'Unknown dependencies of {invocation.name}: {", ".join(unknown)}')
+    remaining = {invocation.name: set(invocation.dependencies) for invocation in invocations}
+    while remaining:
+        ready = [name for name, dependencies in remaining.items() if not dependencies & remaining.keys()]
+        if not ready:
+            raise ValueError(f'Cyclic dependencies between {", ".join(sorted(remaining))}')
+        for name in ready:
+            del remaining[name]
+
+
+def _run_invocation(invocation: Invocation, log_file: str):
+    """Runs a command in the current (forked) process with its output going to `log_file`, never returns"""
+    exit_code = 1
+    try:
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, signal.SIG_DFL)
+        for stream in (sys.stdout, sys.stderr):
+            stream.flush()
+        fd = os.open(log_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        os.dup2(fd, 1)
+        os.dup2(fd, 2)
+        os.close(fd)
+        sys.argv = ['mara'] + invocation.argv
+        from .cli import cli
+        try:
+            cli.main(args=invocation.argv, prog_name='mara')
+            exit_code = 0
+        except SystemExit as e:
+            exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except BaseException:
+        log.exception("Running %s failed", invocation.name)
+    finally:
+        try:
+            for stream in (sys.stdout, sys.stderr):
+                stream.flush()
+        finally:
+            os._exit(exit_code)
+
+
+def run_many(invocations: [Invocation], concurrency: int, log_directory: str = None,
+             on_result: typing.Callable[[Result], None] = None) -> [Result]:
+    """Runs the commands in processes forked from the current one, returns the results in the given order
+
+    `on_result` is called whenever a command finished or was skipped.
+    """
+    from . import get_flattend_configuration
+    from .cli import cli
+
+    _check_dependencies(invocations)
+    # compose the app before forking, also when the commands come from the command manifest,
+    # and import the command modules once
+    get_flattend_configuration('MARA_CLICK_COMMANDS')
+    for invocation in invocations:
+        if cli.get_command(None, invocation.argv[0]) is None:
+            raise ValueError(f'No such command: {invocation.argv[0]}')
+
+    log_directory = log_directory or tempfile.mkdtemp(prefix='mara-run-many-')
+    os.makedirs(log_directory, exist_ok=True)
+    results: {str: Result} = {}
+    pending = list(invocations)
+    running: {int: (Invocation, float, str)} = {}
+
+    def finish(result: Result):
+        results[result.invocation.name] = result
+        if on_result:
+            on_result(result)
+
+    try:
+        while pending or running:
+            for invocation in list(pending):
+                if any(name not in results for name in invocation.dependencies):
+                    continue
+                if any(results[name].exit_code != 0 for name in invocation.dependencies):
+                    pending.remove(invocation)
+                    finish(Result(invocation, None, 0.0, None))
+                    continue
+                if len(running) >= concurrency:
+                    continue
+                pending.remove(invocation)
+                log_file = os.path.join(log_directory, re.sub(r'[^\w.-]', '_', invocation.name) + '.log')
+                pid = os.fork()
+                if pid == 0:
+                    _run_invocation(invocation, log_file)
+                running[pid] = (invocation, time.perf_counter(), log_file)
+            if not running:
+                continue
+            pid, status = os.waitpid(-1, 0)
+            if pid not in running:
+                continue
+            invocation, start, log_file = running.pop(pid)
+            finish(Result(invocation, os.waitstatus_to_exitcode(status), time.perf_counter() - start, log_file))
+    except BaseException:
+        for pid in running:
+            os.kill(pid, signal.SIGTERM)
+        for pid in running:
+            os.waitpid(pid, 0)
+        raise
+    return [results[invocation.name] for invocation in invocations]
+
+
+def print_summary(results: [Result], wall_time: float, file=None):
+    """Prints the exit code, duration and log file of each command and the wall time compared to the sum"""
+    file = file or sys.stdout
+    max_len = max((len(result.invocation.name) for result in results), default=0)
+    for result in results:
+        status = 'skipped' if result.exit_code is None else f'exit {result.exit_code}'
+        print(f'{result.invocation.name:<{max_len}} {status:>8} {result.duration:9.2f} s  {result.log_file or ""}',
+              file=file)
+    total = sum(result.duration for result in results)
+    print(f'Wall time {wall_time:.2f} s, sum of command times {total:.2f} s'
+          + (f' ({total / wall_time:.1f}x)' if wall_time else ''), file=file)
@@ -0,0 +1,60 @@
+"""Helpers for caches which are persisted across `mara` invocations: fingerprints and atomic writes"""
+
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+
+def cache_directory() -> str:
+    """The directory for caches of mara ($XDG_CACHE_HOME/mara)"""
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'mara')
+
+
+def mtime(path: str) -> int:
+    """The modification time of `path` in nanoseconds, None if it doesn't exist"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def file_mtimes(paths: [str]) -> {str: int}:
+    """The modification times of `paths`"""
+    return {path: mtime(path) for path in sorted(set(paths))}
+
+
+def installed_packages_mtimes() -> {str: int}:
+    """The modification times of all package installation directories in `sys.path`
+
+    Installing or removing packages (also in development mode) changes the modification time of the directory
+    they are installed in. Other directories like the app directory are left out, as they change all the time.
+    """
+    return {path: mtime(path) for path in sys.path
+            if os.path.basename(path) in ('site-packages', 'dist-packages') and os.path.isdir(path)}
+
+
+def environment_hash(prefix: str, exclude: [str] = ()) -> str:
+    """A hash of all environment variables which start with `prefix` (case insensitive)"""
+    prefix = prefix.lower()
+    variables = sorted((k, v) for k, v in os.environ.items() if k.lower().startswith(prefix) and k not in exclude)
+    return hashlib.sha1(json.dumps(variables).encode()).hexdigest()
+
+
+def write_json(path: str, data):
+    """Atomically writes `data` as json to `path`, creates the directory if necessary"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(f.name, path)
+
+
+def read_json(path: str):
+    """Reads json from `path`, None if it doesn't exist or is not valid json"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
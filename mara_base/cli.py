@@ -1,11 +1,14 @@
 """Mara admin command line interface"""
 
+import importlib
 import logging
 import os
 import sys
 
 import click
 
+from . import cache_files, startup_profiler
+
 log = logging.getLogger(__name__)
 
 
@@ -22,7 +25,45 @@ def _add_syslog_handler():
 
 
 
-@click.group(help="""\
+class _LazyGroup(click.Group):
+    """A click group which resolves contributed commands from a command manifest
+
+    Only the module which defines the invoked command is imported, `mara --help` imports none of them.
+    """
+    manifest: {str: dict} = None
+
+    def list_commands(self, ctx):
+        return sorted(set(self.commands) | set(self.manifest or {}))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.commands or not self.manifest or cmd_name not in self.manifest:
+            return self.commands.get(cmd_name)
+        entry = self.manifest[cmd_name]
+        try:
+            command = getattr(importlib.import_module(entry['module']), entry['attribute'])
+        except (ImportError, AttributeError, TypeError):
+            log.debug("Could not load command '%s' from the command manifest, composing the app", cmd_name)
+            self.manifest = None
+            # composes the app unless that already happened
+            _add_contributed_commands()
+            return self.commands.get(cmd_name)
+        command.name = cmd_name
+        self.add_command(command)
+        return command
+
+    def format_commands(self, ctx, formatter):
+        if not self.manifest:
+            return super().format_commands(ctx, formatter)
+        rows = [(name, self.manifest[name]['help'] if name in self.manifest and name not in self.commands
+                       else self.commands[name].get_short_help_str())
+                for name in self.list_commands(ctx)
+                if name in self.manifest or not self.commands[name].hidden]
+        if rows:
+            with formatter.section('Commands'):
+                formatter.write_dl(rows)
+
+
+@click.group(cls=_LazyGroup, help="""\
 This shell command acts as general utility script for mara applications.
 
 All configured downloader will be available.
@@ -31,18 +72,33 @@ To run the webapp, use 'flask run'.
 
 """)
 @click.option('--debug/--no-debug', default=False)
-def cli(debug: bool):
-    # --debug is consumed by the setup_commandline_commands but it's here to let it show up in help and
+@click.option('--profile-startup', is_flag=True, default=False,
+              help='Write the timings of the startup phases to a Chrome trace file and print a summary')
+def cli(debug: bool, profile_startup: bool):
+    # --debug and --profile-startup are consumed by main() but they are here to let them show up in help
     pass
 
 def setup_commandline_commands():
     """Needs to be run before click itself is run so the config which contributes click commands is available"""
+    _setup_logging_and_config()
+
+    from . import _call_app_composing_function
+    with startup_profiler.phase('_call_app_composing_function'):
+        _call_app_composing_function()
+
+    _add_contributed_commands()
+
+
+def _setup_logging_and_config():
+    """Sets up logging and loads the config from local_setup.py and the environment"""
     debug = '--debug' in sys.argv
-    logging.basicConfig(level=logging.INFO,
-                        format='%(asctime)s %(levelname)s, %(name)s: %(message)s',
-                        datefmt='%Y-%m-%dT%H:%M:%S',
-                        stream=sys.stdout)
-    _add_syslog_handler()
+    with startup_profiler.phase('logging setup'):
+        logging.basicConfig(level=logging.INFO,
+                            format='%(asctime)s %(levelname)s, %(name)s: %(message)s',
+                            datefmt='%Y-%m-%dT%H:%M:%S',
+                            stream=sys.stdout)
+    with startup_profiler.phase('_add_syslog_handler'):
+        _add_syslog_handler()
 
     if debug:
         logging.root.setLevel(logging.DEBUG)
@@ -50,8 +106,34 @@ def setup_commandline_commands():
 
     # Initialize the config system
     from .config_system import add_config_from_environment, add_config_from_local_setup_py
-    add_config_from_local_setup_py()
-    add_config_from_environment()
+    from .config_system.snapshot import load_config_snapshot, config_snapshot_path
+    with startup_profiler.phase('load_config_snapshot'):
+        snapshot_loaded = load_config_snapshot(config_snapshot_path())
+    if not snapshot_loaded:
+        with startup_profiler.phase('add_config_from_local_setup_py'):
+            add_config_from_local_setup_py()
+        with startup_profiler.phase('add_config_from_environment'):
+            add_config_from_environment()
+
+    from .config_system import _async_implementations
+    if _async_implementations():
+        from .config_system.prefetch import prefetch_config
+        with startup_profiler.phase('prefetch_config'):
+            prefetch_config()
+
+    from .config_system.reload import watch_config, start_watching
+    if watch_config():
+        start_watching()
+
+    from .config import log_queue as configured_log_queue, log_queue_size, log_queue_overflow
+    if configured_log_queue():
+        from . import log_queue
+        log_queue.start(capacity=log_queue_size(), overflow=log_queue_overflow())
+
+    if debug:
+        # the commandline switch wins over any other config
+        from .config_system import replace
+        replace('debug', function=_debug_from_commandline, layer='cli')
 
     # we try the second mechanism as well
     from .config import debug as configured_debug
@@ -59,34 +141,226 @@ def setup_commandline_commands():
         logging.root.setLevel(logging.DEBUG)
         log.debug("Enabled debug output via config")
 
-    # overwrite any config system with commandline debug switch
-    if debug and not configured_debug():
-        from .config_system import replace
-        replace('debug', function = lambda: True)
 
-    from . import _call_app_composing_function
-    _call_app_composing_function()
+def _debug_from_commandline() -> bool:
+    return True
+
 
+def _add_contributed_commands() -> [click.Command]:
+    """Adds all contributed click commands to the cli group, returns the added commands"""
     from . import get_flattend_configuration
+    commands = []
     for module, command in get_flattend_configuration('MARA_CLICK_COMMANDS'):
         if command and 'callback' in command.__dict__ and command.__dict__['callback']:
             package = command.__dict__['callback'].__module__.rpartition('.')[0]
             if package != 'flask':
                 command.name = package + '.' + command.name
                 cli.add_command(command)
+                commands.append(command)
+    return commands
+
+
+def _fingerprint(files: [str]) -> dict:
+    """The state which invalidates the command manifest when it changes
+
+    Installing or removing packages changes the modification time of the package installation directories,
+    changes to the app or the command modules change the modification times of their files.
+    """
+    from .config import default_app_module
+    return {'mara_app': default_app_module(),
+            'installed_packages': cache_files.installed_packages_mtimes(),
+            'files': cache_files.file_mtimes(files)}
+
+
+def _replacements() -> tuple:
+    """The state of the config layers and of the monkey patches, to find out whether composing the app changed it"""
+    from .config_system import LAYERS, _get_layer
+    from .monkey_patch import REPLACED_FUNCTIONS
+    return tuple(_get_layer(layer) for layer in LAYERS[1:]) + (dict(REPLACED_FUNCTIONS),)
+
+
+def _write_command_manifest(commands: [click.Command], compose_eagerly: bool):
+    """Persists names, help texts and defining modules of all contributed commands
+
+    With `compose_eagerly`, the app is composed before running a command from the manifest, because
+    composing it replaces config functions or patches functions.
+    """
+    from . import get_flattend_configuration
+    from .config import default_app_module, command_manifest_path
+    entries = {}
+    files = []
+    # the modules which contribute commands and the ones which define them
+    contributing_modules = [module.__name__ for module, _ in get_flattend_configuration('MARA_CLICK_COMMANDS')]
+    for module_name in ([default_app_module()] + contributing_modules
+                        + [command.callback.__module__ for command in commands]):
+        module_file = getattr(sys.modules.get(module_name), '__file__', None)
+        if module_file:
+            files.append(module_file)
+    for command in commands:
+        module = sys.modules[command.callback.__module__]
+        # the command object is usually stored under the name of the decorated function
+        attribute = next((name for name, value in vars(module).items() if value is command), None)
+        entries[command.name] = {'help': command.get_short_help_str(),
+                                 'module': module.__name__,
+                                 'attribute': attribute}
+    path = command_manifest_path()
+    try:
+        cache_files.write_json(path, {'fingerprint': _fingerprint(files), 'compose_eagerly': compose_eagerly,
+                                      'commands': entries})
+        log.debug("Wrote command manifest to %s", path)
+    except OSError as e:
+        log.debug("Could not write command manifest to %s: %s", path, e)
+
+
+def _load_command_manifest() -> bool:
+    """Makes the commands from a still valid command manifest available, returns whether it was usable"""
+    from .config import command_manifest_path
+    path = command_manifest_path()
+    manifest = cache_files.read_json(path)
+    if not manifest:
+        return False
+    if (manifest.get('fingerprint') != _fingerprint(manifest.get('fingerprint', {}).get('files', {}).keys())
+            or any(entry['attribute'] is None for entry in manifest['commands'].values())):
+        log.debug("Command manifest %s is outdated", path)
+        return False
+    cli.manifest = manifest['commands']
+    from . import _call_app_composing_function, _compose_app_on_first_use
+    if manifest.get('compose_eagerly', True):
+        # the replacements and patches of the app have to be in place before the command runs
+        with startup_profiler.phase('_call_app_composing_function'):
+            _call_app_composing_function()
+    else:
+        # commands which consume contributed functionality get the composed app on first use
+        _compose_app_on_first_use()
+    return True
 
 
 def main():
-    setup_commandline_commands()
+    if '--profile-startup' in sys.argv:
+        startup_profiler.enable()
+    from .server import _subcommand
+    if _subcommand(sys.argv[1:]) == 'config-stats':
+        # the calls during the startup are counted as well
+        from .config_system import enable_call_statistics
+        enable_call_statistics()
+    _setup_logging_and_config()
+    from .config import lazy_command_loading
+    if not (lazy_command_loading() and _load_command_manifest()):
+        from . import _call_app_composing_function
+        replacements = _replacements()
+        with startup_profiler.phase('_call_app_composing_function'):
+            _call_app_composing_function()
+        compose_eagerly = _replacements() != replacements
+        with startup_profiler.phase('_add_contributed_commands'):
+            commands = _add_contributed_commands()
+        if lazy_command_loading():
+            with startup_profiler.phase('_write_command_manifest'):
+                _write_command_manifest(commands, compose_eagerly)
     args = sys.argv[1:]
-    cli.main(args=args, prog_name='mara')
+    try:
+        with startup_profiler.phase('command', category='command'):
+            cli.main(args=args, prog_name='mara')
+    finally:
+        if startup_profiler.enabled:
+            _write_startup_profile()
+
+
+def _write_startup_profile():
+    from .config import startup_trace_path
+    path = startup_trace_path()
+    startup_profiler.write_trace(path)
+    startup_profiler.print_summary()
+    print(f'Wrote startup trace to {path}', file=sys.stderr)
 
 
 @cli.command()
-def print_config():
+@click.option('--format', type=click.Choice(['text', 'json']), default='text', help='The output format')
+@click.option('--namespace', default=None, help='Only config functions whose names start with it, e.g. "mara_db."')
+def print_config(format: str, namespace: str):
     """Prints the current config"""
     from .config_system import print_config
-    print_config()
+    print_config(format, namespace)
+
+
+@cli.group()
+def config():
+    """Commands for the config system"""
+
+
+@config.command()
+@click.option('--output', default=None,
+              help='The snapshot file (Default: $MARA_CONFIG_SNAPSHOT or mara-config-snapshot.json)')
+def freeze(output: str):
+    """Writes the resolved config values to a snapshot which is used at startup via $MARA_CONFIG_SNAPSHOT"""
+    from .config_system.snapshot import freeze_config, config_snapshot_path
+    path = output or config_snapshot_path() or 'mara-config-snapshot.json'
+    not_frozen = freeze_config(path)
+    if not_frozen:
+        print(f'Could not freeze {", ".join(not_frozen)}, the snapshot in {path} will not be used at startup',
+              file=sys.stderr)
+        sys.exit(1)
+    print(f'Wrote config snapshot to {path}')
+
+
+@cli.command(context_settings={'ignore_unknown_options': True, 'allow_interspersed_args': False})
+@click.option('--sample-every', default=1, help='Only time every n-th call')
+@click.argument('command', nargs=-1, type=click.UNPROCESSED)
+def config_stats(sample_every: int, command: [str]):
+    """Runs COMMAND and prints how often config functions were called and how long they took
+
+    Without COMMAND, the statistics of the startup of mara itself are printed.
+    """
+    from .config_system import enable_call_statistics, get_call_statistics
+    enable_call_statistics(sample_every)
+    if command:
+        try:
+            cli.main(args=list(command), prog_name='mara', standalone_mode=False)
+        except SystemExit:
+            pass
+    statistics = get_call_statistics()
+    max_len = max((len(statistic.config_name) for statistic in statistics), default=0)
+    for statistic in statistics:
+        mean = '' if statistic.mean_duration is None else f'{statistic.mean_duration * 1e6:10.2f} µs'
+        print(f'{statistic.config_name:<{max_len}} {statistic.calls:10d}x {mean:>13}  {statistic.implementation}',
+              file=sys.stderr)
+
+
+@cli.command()
+@click.option('--file', 'file_', type=click.File(), default=None,
+              help='A file with one command per line, "-" for stdin')
+@click.option('--concurrency', type=click.IntRange(min=1), default=None,
+              help='How many commands run at the same time (Default: mara_base.run_many_concurrency)')
+@click.option('--log-directory', default=None, help='Where the logs of the commands are written (Default: a temp directory)')
+@click.argument('invocations', nargs=-1)
+def run_many(file_, concurrency: int, log_directory: str, invocations: [str]):
+    """Runs many commands in parallel in processes forked from the composed app
+
+    Each command is a line like `[NAME [<- DEPENDENCY, ...]:] COMMAND ARGS`, given as argument or in a file.
+    Commands only start after the commands they depend on succeeded.
+    """
+    import time
+    from . import batch
+    from .config import run_many_concurrency
+    start = time.perf_counter()
+    try:
+        parsed = batch.parse_invocations(list(invocations) + (file_.readlines() if file_ else []))
+        results = batch.run_many(
+            parsed, concurrency or run_many_concurrency(), log_directory,
+            on_result=lambda result: log.info("%s %s", result.invocation.name,
+                                              'skipped' if result.exit_code is None
+                                              else f'finished with exit code {result.exit_code}'))
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    batch.print_summary(results, time.perf_counter() - start)
+    if any(result.exit_code != 0 for result in results):
+        sys.exit(1)
+
+
+@cli.command()
+def serve():
+    """Keeps the composed app running and runs the commands of `mara` in forked processes"""
+    from . import server
+    server.serve()
 
 
 if __name__ == '__main__':
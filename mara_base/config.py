@@ -1,4 +1,5 @@
 """Default configurtion visible in all mara packages"""
+import hashlib
 import os
 
 from .config_system import replaceable
@@ -15,3 +16,47 @@ def default_app_module():
     # this is not replaceable in local_setup.py, only 'replaceable' to get it show up in the flask view
     # hack to already get the info before the config system is fully initialized
     return os.environ.get('MARA_APP', 'app.app')
+
+
+@replaceable("mara_base.lazy_command_loading")
+def lazy_command_loading():
+    """Whether `mara` loads click commands from a cached command manifest instead of composing the app first"""
+    return False
+
+
+@replaceable("mara_base.command_manifest_path")
+def command_manifest_path():
+    """Where the names, help texts and modules of all contributed click commands are cached"""
+    from .cache_files import cache_directory
+    key = hashlib.sha1(f'{os.getcwd()}:{default_app_module()}'.encode()).hexdigest()[:12]
+    return os.path.join(cache_directory(), f'commands-{key}.json')
+
+
+@replaceable("mara_base.startup_trace_path")
+def startup_trace_path():
+    """Where `mara --profile-startup` writes the Chrome trace events of the startup phases"""
+    return 'mara-startup-trace.json'
+
+
+@replaceable("mara_base.log_queue")
+def log_queue() -> bool:
+    """Whether the log handlers of `mara` commands are called from a background thread instead of blocking"""
+    return False
+
+
+@replaceable("mara_base.log_queue_size")
+def log_queue_size() -> int:
+    """How many log records can be queued before the overflow policy applies"""
+    return 10000
+
+
+@replaceable("mara_base.log_queue_overflow")
+def log_queue_overflow() -> str:
+    """What happens to log records when the log queue is full: 'drop' (and count) them or 'block' until there is space"""
+    return 'drop'
+
+
+@replaceable("mara_base.run_many_concurrency")
+def run_many_concurrency() -> int:
+    """How many commands `mara run-many` runs at the same time (Default: the number of CPUs)"""
+    return os.cpu_count() or 1
@@ -8,48 +8,439 @@ The config system consists of two ends:
 It can use environment variables and actual function implementations to replace the config function
 
 """
+import bisect
+import contextlib
+import contextvars
 import functools
+import inspect
+import json
 import logging
 import os
-from typing import Callable, Tuple, Dict, List
+import pathlib
+import re
+import threading
+import time
+import typing
+from typing import Callable, Tuple, Dict, List, Set
 
 log = logging.getLogger(__name__)
 
+LAYERS = ('defaults', 'package', 'local_setup', 'environment', 'cli', 'shared', 'runtime')
+"""The sources of config functions, from lowest to highest precedence
+
+`defaults` are the replaceable functions themselves, all other layers contain replacements. `shared` contains
+the values published by other processes (see `shared.share_config`).
+"""
+
+
+class Provenance(typing.NamedTuple):
+    """Where the current implementation of a config function comes from"""
+    layer: str
+    source: str
+    """module.name of the implementation, or the environment variable"""
+
+
+class _Replacement(typing.NamedTuple):
+    function: Callable
+    include_original_function: bool
+    source: str
+
+
+__LAYERS: Dict[str, Dict[str, _Replacement]] = {layer: {} for layer in LAYERS[1:]}
+"""The replacements per layer, only accessed under `_registry_lock`"""
+
+# The resolved registries are copy-on-write: they are never mutated but replaced by a changed copy
+# (under `_registry_lock`), so readers never need a lock
 __CONFIG_REGISTRY: Dict[str, Tuple[Callable, bool]] = {}
+"""The winning replacement per config name, recomputed when a layer changes"""
+__PROVENANCE: Dict[str, Provenance] = {}
 __ORIG_API_REGISTRY: Dict[str, Callable] = {}
+__NAMES: List[str] = None
+"""The sorted names of all declared or replaced config functions, None when it has to be rebuilt"""
+
+_registry_lock = threading.RLock()
+"""Serializes changes of the registries and of the slots, always accessed as a module attribute"""
+
+
+def _after_fork_in_child():
+    """The lock might have been held by another thread of the parent while forking"""
+    global _registry_lock
+    _registry_lock = threading.RLock()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+class _Slot:
+    """The dispatch target of a replaceable function
+
+    `replace()` rebinds `target` once, so a call of a replaceable function costs a single indirection
+    instead of registry lookups on every call.
+    """
+    __slots__ = ('original', 'target', 'cache')
+
+    def __init__(self, original: Callable, cache: bool = False):
+        self.original = original
+        self.target = original
+        self.cache = {} if cache else None
+
+
+__SLOTS: Dict[str, _Slot] = {}
+
+__DEPENDENTS: Dict[str, Set[str]] = {}
+"""Maps a config name to the names of all cached config values which read it while being computed"""
+
+_current_reads: contextvars.ContextVar = contextvars.ContextVar('mara_config_current_reads', default=None)
+"""The set of config names read by the cached config value which is currently computed"""
+
+_track_reads = False
+"""Whether calls are recorded for dependency tracking (only needed once a cached replaceable exists)"""
+
+_overrides: contextvars.ContextVar = contextvars.ContextVar('mara_config_overrides', default=None)
+"""The config functions which are overridden in the current context"""
+
+_override_counts: Dict[str, int] = {}
+"""The number of active `override()` blocks per config name, in any context"""
+
+_current_layer: contextvars.ContextVar = contextvars.ContextVar('mara_config_current_layer', default='package')
+"""The layer `replace()` adds to when no layer is given"""
+
+_staged: contextvars.ContextVar = contextvars.ContextVar('mara_config_staged', default=None)
+"""When set, `replace()` collects replacements per layer in it instead of applying them (for reloading)"""
+
+_generation = 0
+"""Bumped whenever the implementation of a config function changes"""
+
+
+def config_generation() -> int:
+    """A number which changes whenever config functions are declared or replaced
+
+    Caches of values derived from config can store it and compare it instead of watching the config.
+    """
+    return _generation
+
+
+def _recording(config_name: str, target: Callable) -> Callable:
+    """Wraps `target` so that calls are recorded as a dependency of the currently computed cached value"""
+
+    def recording_target(*args, **kwargs):
+        reads = _current_reads.get()
+        if reads is not None:
+            reads.add(config_name)
+        return target(*args, **kwargs)
+
+    return recording_target
+
+
+def _caching(config_name: str, cache: dict, target: Callable) -> Callable:
+    """Wraps `target` so that results are memoized and the config names read while computing them are recorded"""
+
+    def caching_target(*args, **kwargs):
+        reads = _current_reads.get()
+        if reads is not None:
+            reads.add(config_name)
+        if _overrides.get():
+            # values computed with overridden config must not end up in the shared cache
+            return target(*args, **kwargs)
+        key = (args, tuple(sorted(kwargs.items()))) if kwargs else args
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # unhashable arguments
+            return target(*args, **kwargs)
+        own_reads = set()
+        generation = _generation
+        token = _current_reads.set(own_reads)
+        try:
+            value = target(*args, **kwargs)
+        finally:
+            _current_reads.reset(token)
+        for dependency in own_reads:
+            __DEPENDENTS.setdefault(dependency, set()).add(config_name)
+        if _generation == generation:
+            # otherwise a dependency might have been replaced (and the cache invalidated) while computing
+            cache[key] = value
+        return value
+
+    return caching_target
+
+
+def _overridable(config_name: str, target: Callable) -> Callable:
+    """Wraps `target` so that an `override()` in the current context wins"""
+
+    def overridable_target(*args, **kwargs):
+        overrides = _overrides.get()
+        if overrides is not None and config_name in overrides:
+            return overrides[config_name](*args, **kwargs)
+        return target(*args, **kwargs)
+
+    return overridable_target
+
+
+class CallStatistics(typing.NamedTuple):
+    """How often an implementation of a config function was called and how long it took"""
+    config_name: str
+    implementation: str
+    """module.name of the original function or of the replacement"""
+    calls: int
+    mean_duration: float
+    """Mean seconds per call, None if no call was timed"""
+
+
+_statistics: Dict[Tuple[str, str], List[int]] = None
+"""[calls, timed calls, timed nanoseconds] per config name and implementation, None if not collected"""
+
+_statistics_sample_every = 1
+
+
+def _counting(config_name: str, implementation: Callable, target: Callable) -> Callable:
+    """Wraps `target` so that calls are counted and every n-th call is timed"""
+    key = (config_name, f'{getattr(implementation, "__module__", None)}.'
+                        f'{getattr(implementation, "__qualname__", type(implementation).__name__)}')
+    counters = _statistics.setdefault(key, [0, 0, 0])
+    sample_every = _statistics_sample_every
+
+    def counting_target(*args, **kwargs):
+        counters[0] += 1
+        if counters[0] % sample_every:
+            return target(*args, **kwargs)
+        start = time.perf_counter_ns()
+        try:
+            return target(*args, **kwargs)
+        finally:
+            counters[2] += time.perf_counter_ns() - start
+            counters[1] += 1
+
+    return counting_target
+
+
+def enable_call_statistics(sample_every: int = 1):
+    """Starts counting the calls of all config functions and timing every `sample_every`-th call
+
+    When not enabled, config functions are called without any instrumentation.
+    """
+    global _statistics, _statistics_sample_every
+    with _registry_lock:
+        if _statistics is None:
+            _statistics = {}
+        _statistics_sample_every = sample_every
+        for config_name in __SLOTS:
+            _rebind(config_name)
+
+
+def disable_call_statistics():
+    """Stops collecting call statistics and discards them"""
+    global _statistics
+    with _registry_lock:
+        _statistics = None
+        for config_name in __SLOTS:
+            _rebind(config_name)
+
+
+def get_call_statistics() -> List[CallStatistics]:
+    """The collected call statistics, most called first"""
+    statistics = _statistics or {}
+    return sorted([CallStatistics(config_name, implementation, calls,
+                                  timed_ns / timed_calls / 1e9 if timed_calls else None)
+                   for (config_name, implementation), (calls, timed_calls, timed_ns) in list(statistics.items())
+                   if calls],
+                  key=lambda statistic: (-statistic.calls, statistic.config_name))
+
+
+if os.environ.get('MARA_CONFIG_STATISTICS'):
+    # not a replaceable function: the calls are counted from the first declaration on, e.g. in a web process
+    try:
+        enable_call_statistics(int(os.environ['MARA_CONFIG_STATISTICS']))
+    except ValueError:
+        log.error("MARA_CONFIG_STATISTICS is not the number of calls after which one is timed: %s",
+                  os.environ['MARA_CONFIG_STATISTICS'])
+
+
+_shared_check: Callable[[], bool] = None
+"""When config values are shared between processes: applies the changes of other processes, returns whether
+there were any (see `shared.share_config`)"""
+
+_publish: Callable[[typing.Iterable[str]], None] = None
+"""When config values are shared between processes: publishes the values of changed config functions"""
+
+_applying_shared = False
+"""Whether the `shared` layer is currently replaced with the values of other processes"""
+
+
+def _synchronized(config_name: str, target: Callable) -> Callable:
+    """Wraps `target` so that changes of other processes are applied before it is called"""
+    check = _shared_check
+
+    def synchronized_target(*args, **kwargs):
+        if check():
+            # the slot was rebound
+            return __SLOTS[config_name].target(*args, **kwargs)
+        return target(*args, **kwargs)
+
+    return synchronized_target
+
 
+def _set_sharing(check: Callable[[], bool], publish: Callable[[typing.Iterable[str]], None]):
+    """Installs (or with None, removes) the hooks for sharing config values between processes"""
+    global _shared_check, _publish
+    with _registry_lock:
+        _shared_check, _publish = check, publish
+        for config_name in __SLOTS:
+            _rebind(config_name)
 
-def replaceable(config_name=None):
+
+def _unshared_function(config_name: str) -> Tuple[Callable, Provenance]:
+    """The implementation of a config function without the `shared` layer, None if it's not declared (yet)"""
+    original = __ORIG_API_REGISTRY.get(config_name)
+    with _registry_lock:
+        for layer in reversed(LAYERS[1:]):
+            replacement = __LAYERS[layer].get(config_name)
+            if layer != 'shared' and replacement is not None:
+                function = (functools.partial(replacement.function, original_function=original)
+                            if replacement.include_original_function else replacement.function)
+                return function, Provenance(layer, replacement.source)
+    return original, Provenance('defaults', _name(original) if original else None)
+
+
+_async_results: Dict[str, dict] = {}
+"""The results of async config functions per config name and arguments"""
+
+
+def _run_sync(coroutine: typing.Coroutine):
+    """Runs `coroutine` to completion, also when called from a running event loop"""
+    import asyncio
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    # the running loop can't be blocked on, so the coroutine gets its own loop in another thread
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+def _awaiting(config_name: str, target: Callable) -> Callable:
+    """Wraps the coroutine function `target`, so that it can be called synchronously
+
+    The results are kept (per arguments) until the config function is replaced, see `prefetch.prefetch_config`
+    for resolving them concurrently at startup.
+    """
+
+    def awaiting_target(*args, **kwargs):
+        results = _async_results.setdefault(config_name, {})
+        key = (args, tuple(sorted(kwargs.items()))) if kwargs else args
+        try:
+            return results[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # unhashable arguments
+            return _run_sync(target(*args, **kwargs))
+        value = results[key] = _run_sync(target(*args, **kwargs))
+        return value
+
+    return awaiting_target
+
+
+def _invalidate(config_name: str):
+    """Drops the cached values of `config_name` and of all cached values which (transitively) depend on it"""
+    pending = [config_name]
+    seen = set()
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        slot = __SLOTS.get(name)
+        if slot is not None and slot.cache:
+            slot.cache.clear()
+        _async_results.pop(name, None)
+        pending.extend(__DEPENDENTS.pop(name, ()))
+
+
+def _rebind(config_name: str):
+    """Points the slot of a replaceable function to its current implementation"""
+    slot = __SLOTS.get(config_name)
+    if slot is None:
+        # replaced before the replaceable function was declared, bound in @replaceable
+        return
+    if config_name in __CONFIG_REGISTRY:
+        replacement_func, include_original_function = __CONFIG_REGISTRY[config_name]
+        if include_original_function:
+            target = functools.partial(replacement_func, original_function=slot.original)
+        else:
+            target = replacement_func
+        implementation = replacement_func
+    else:
+        target = implementation = slot.original
+    if inspect.iscoroutinefunction(implementation):
+        target = _awaiting(config_name, target)
+    if slot.cache is not None:
+        target = _caching(config_name, slot.cache, target)
+    elif _track_reads:
+        target = _recording(config_name, target)
+    if config_name in _override_counts:
+        target = _overridable(config_name, target)
+    if _statistics is not None:
+        target = _counting(config_name, implementation, target)
+    if _shared_check is not None:
+        target = _synchronized(config_name, target)
+    slot.target = target
+
+
+def replaceable(config_name=None, cache: bool = False):
     """Decorator for public API which can be replaced by downstream packages
 
     The default config_name is modulename.funcname.
+
+    With `cache=True`, results are memoized per arguments. The config values read while computing a
+    result are recorded, so that a `replace()` of any of them invalidates the cached result.
     """
     outer_config_name = config_name
 
     def _replaceable(func):
+        global _track_reads, __ORIG_API_REGISTRY, __NAMES, _generation
         config_name = (outer_config_name if outer_config_name
                        else (func.__module__ or '<no_module>') + '.' + func.__name__)
         log.debug("Registered new replaceable function '%s'", config_name)
-        __ORIG_API_REGISTRY[config_name] = func
+        with _registry_lock:
+            _journal(config_name)
+            if config_name not in __ORIG_API_REGISTRY and config_name not in __CONFIG_REGISTRY:
+                __NAMES = None
+            __ORIG_API_REGISTRY = {**__ORIG_API_REGISTRY, config_name: func}
+            if config_name in __SLOTS:
+                # declared twice: all wrappers dispatch via the same slot, the last declaration wins
+                slot = __SLOTS[config_name]
+                slot.original = func
+                slot.cache = {} if cache else None
+            else:
+                slot = __SLOTS[config_name] = _Slot(func, cache=cache)
+            if cache and not _track_reads:
+                # from now on, all replaceable functions need to record their calls
+                _track_reads = True
+                for name in __SLOTS:
+                    _rebind(name)
+            else:
+                _rebind(config_name)
+            _invalidate(config_name)
+            _generation += 1
 
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            if config_name in __CONFIG_REGISTRY:
-                replacement_func, include_original_function = __CONFIG_REGISTRY[config_name]
-                if include_original_function:
-                    kwargs['original_function'] = func
-                # log.debug("Using replaced function '%s'", replacement_func.__name__)
-                return replacement_func(*args, **kwargs)
-            else:
-                # log.debug("Using original function '%s'", func.__name__)
-                return func(*args, **kwargs)
+            return slot.target(*args, **kwargs)
 
         return wrapper
 
     return _replaceable
 
 
-def replace(config_name: str, include_original_function=False, function: Callable = None):
+def _name(function: Callable) -> str:
+    return f'{function.__module__}.{getattr(function, "__qualname__", function.__class__.__name__)}'
+
+
+def replace(config_name: str, include_original_function=False, function: Callable = None, layer: str = None):
     """Replaces a API function in another package
 
     Can be used as a decorator:
@@ -63,73 +454,475 @@ def replace(config_name: str, include_original_function=False, function: Callabl
     >>> if should_be_replaced:
     >>>     replace('soh_without_function_pointer', replacement)
 
+    Replacements are added to `layer` (see `LAYERS`), by default to `local_setup` while local_setup.py is
+    loaded and to `package` otherwise. A replacement in a higher layer wins, regardless of the order of
+    the `replace()` calls.
     """
     if function is None:
         # usage as decorator
         def submitting_decorator(func):
-            replace(config_name=config_name, include_original_function=include_original_function, function=func)
+            replace(config_name=config_name, include_original_function=include_original_function, function=func,
+                    layer=layer)
             return func
 
         return submitting_decorator
     else:
         assert callable(function), f"New function for '{config_name}' is not callable: {type(function)}"
-        if config_name in __CONFIG_REGISTRY:
-            orig_replacement, _ = __CONFIG_REGISTRY[config_name]
-            log.warn("Replacing already replaced function for '%s': %s.%s",
-                     config_name, orig_replacement.__module__, orig_replacement.__name__)
-        __CONFIG_REGISTRY[config_name] = (function, include_original_function)
-        log.debug("Replacing function '%s' with %s.%s", config_name, function.__module__, function.__name__)
+        _replace(config_name, _Replacement(function, include_original_function, _name(function)), layer)
+
+
+def _replace(config_name: str, replacement: _Replacement, layer: str = None):
+    layer = layer or _current_layer.get()
+    assert layer in __LAYERS, f"Unknown config layer '{layer}', expected one of {', '.join(LAYERS[1:])}"
+    staged = _staged.get()
+    if staged is not None:
+        staged.setdefault(layer, {})[config_name] = replacement
+        return
+    with _registry_lock:
+        _journal(config_name)
+        existing = __LAYERS[layer].get(config_name)
+        if existing is not None and existing.source != replacement.source:
+            log.warn("Replacing already replaced function for '%s' in the %s layer: %s",
+                     config_name, layer, existing.source)
+        __LAYERS[layer][config_name] = replacement
+        _resolve([config_name])
+        winner = __PROVENANCE[config_name].layer
+        if winner != layer:
+            log.debug("Replacement of '%s' in the %s layer is shadowed by the %s layer", config_name, layer, winner)
+    log.debug("Replacing function '%s' with %s in the %s layer", config_name, replacement.source, layer)
+
+
+def _replace_layer(layer: str, replacements: Dict[str, _Replacement]) -> List[str]:
+    """Replaces all replacements of `layer` at once, returns the names of the changed config functions"""
+    return _replace_layers({layer: replacements})
+
+
+def _replace_layers(layers: Dict[str, Dict[str, _Replacement]]) -> List[str]:
+    """Replaces the replacements of several layers in one step, returns the names of the changed config functions
+
+    Callers never see a state in which only some of the layers are replaced.
+    """
+    with _registry_lock:
+        changed = set()
+        for layer, replacements in layers.items():
+            previous = __LAYERS[layer]
+            replacements = dict(replacements)
+            for config_name in previous.keys() | replacements.keys():
+                if config_name in previous and config_name in replacements \
+                        and _identity(previous[config_name]) == _identity(replacements[config_name]):
+                    # e.g. the same environment variable or the same function from a reloaded module
+                    replacements[config_name] = previous[config_name]
+                else:
+                    _journal(config_name)
+                    changed.add(config_name)
+            __LAYERS[layer] = replacements
+        _resolve(changed)
+    return sorted(changed)
+
+
+def _identity(replacement: _Replacement) -> tuple:
+    """What makes two replacements equivalent, also when their functions were created again"""
+    function = replacement.function
+    if hasattr(function, 'raw_value'):
+        function = function.raw_value
+    elif getattr(function, '__closure__', True) is None and hasattr(function, '__code__'):
+        function = (function.__code__, function.__defaults__, function.__kwdefaults__)
+    return replacement.source, replacement.include_original_function, function
+
+
+def _get_layer(layer: str) -> Dict[str, _Replacement]:
+    """A copy of the replacements of `layer`"""
+    with _registry_lock:
+        return dict(__LAYERS[layer])
+
+
+def _resolve(config_names: typing.Iterable[str]):
+    """Recomputes the winning replacement of `config_names` and points their slots to it"""
+    global __CONFIG_REGISTRY, __PROVENANCE, __NAMES, _generation
+    if not config_names:
+        return
+    registry, provenance = dict(__CONFIG_REGISTRY), dict(__PROVENANCE)
+    for config_name in config_names:
+        for layer in reversed(LAYERS[1:]):
+            replacement = __LAYERS[layer].get(config_name)
+            if replacement is not None:
+                if config_name not in registry and config_name not in __ORIG_API_REGISTRY:
+                    __NAMES = None
+                registry[config_name] = (replacement.function, replacement.include_original_function)
+                provenance[config_name] = Provenance(layer, replacement.source)
+                break
+        else:
+            if config_name in registry and config_name not in __ORIG_API_REGISTRY:
+                __NAMES = None
+            registry.pop(config_name, None)
+            provenance.pop(config_name, None)
+    __CONFIG_REGISTRY, __PROVENANCE = registry, provenance
+    for config_name in config_names:
+        _rebind(config_name)
+        _invalidate(config_name)
+    _generation += 1
+    if _publish is not None and not _applying_shared:
+        _publish(config_names)
+
+
+def get_provenance(config_name: str) -> Provenance:
+    """The layer and the implementation which supply the current value of a config function"""
+    provenance = __PROVENANCE.get(config_name)
+    if provenance is not None:
+        return provenance
+    original = __ORIG_API_REGISTRY.get(config_name)
+    return Provenance('defaults', _name(original) if original else None)
+
+
+@contextlib.contextmanager
+def _loading_layer(layer: str):
+    """Makes `replace()` add to `layer` by default in the current context"""
+    token = _current_layer.set(layer)
+    try:
+        yield
+    finally:
+        _current_layer.reset(token)
+
+
+_overlays: List[Dict[str, tuple]] = []
+"""The undo journals of the active `overlay()` blocks, innermost last"""
+
+
+def _journal(config_name: str):
+    """Records the state of `config_name` before its first change in the innermost overlay"""
+    if _overlays and config_name not in _overlays[-1]:
+        slot = __SLOTS.get(config_name)
+        _overlays[-1][config_name] = (tuple(__LAYERS[layer].get(config_name) for layer in LAYERS[1:]),
+                                      __ORIG_API_REGISTRY.get(config_name),
+                                      slot is not None and slot.cache is not None)
+
+
+@contextlib.contextmanager
+def overlay():
+    """Undoes all replacements done within the block, e.g. in a test
+
+    Entering the block costs nothing, leaving it only touches the config functions which were replaced.
+    Config functions declared within the block stay declared (their modules stay imported), declaring an
+    already declared config function again is undone. Overlays can be nested, but are not thread-local:
+    blocks in several threads must not overlap.
+    """
+    global __ORIG_API_REGISTRY
+    journal = {}
+    _overlays.append(journal)
+    try:
+        yield
+    finally:
+        with _registry_lock:
+            assert _overlays[-1] is journal, 'Overlays are left in a different order than they were entered'
+            _overlays.pop()
+            originals = {}
+            for config_name, (replacements, original, cache) in journal.items():
+                for layer, replacement in zip(LAYERS[1:], replacements):
+                    if replacement is None:
+                        __LAYERS[layer].pop(config_name, None)
+                    else:
+                        __LAYERS[layer][config_name] = replacement
+                slot = __SLOTS.get(config_name)
+                if original is not None:
+                    originals[config_name] = original
+                    if slot is not None:
+                        slot.original = original
+                        slot.cache = {} if cache else None
+            if originals:
+                __ORIG_API_REGISTRY = {**__ORIG_API_REGISTRY, **originals}
+            _resolve(list(journal))
 
 
 def _reset_config():
     """Reset config internal state
 
     Internal function for testing purpose"""
-    for k in list(__CONFIG_REGISTRY.keys()):
-        del __CONFIG_REGISTRY[k]
-    for k in list(__ORIG_API_REGISTRY.keys()):
-        del __ORIG_API_REGISTRY[k]
+    global __CONFIG_REGISTRY, __ORIG_API_REGISTRY, __PROVENANCE, __NAMES, _generation
+    with _registry_lock:
+        if _overlays:
+            for config_name in set(__ORIG_API_REGISTRY).union(*__LAYERS.values()):
+                _journal(config_name)
+        __CONFIG_REGISTRY = {}
+        __PROVENANCE = {}
+        __ORIG_API_REGISTRY = {}
+        __NAMES = None
+        for replacements in __LAYERS.values():
+            replacements.clear()
+        # already decorated functions keep their slot but fall back to the original implementation
+        for k in __SLOTS:
+            _rebind(k)
+            _invalidate(k)
+        __DEPENDENTS.clear()
+        _generation += 1
 
 
 def get_get_current_config() -> List[Tuple[str, Callable]]:
     return list(__CONFIG_REGISTRY.items())
 
 
+def _get_original_function(config_name: str) -> Callable:
+    """The original implementation of a replaceable function, None if it's not declared (yet)"""
+    return __ORIG_API_REGISTRY.get(config_name)
+
+
+def _current_function(config_name: str) -> Callable:
+    """The current implementation of a declared or replaced config function, None if it's neither"""
+    if config_name in __ORIG_API_REGISTRY:
+        return __SLOTS[config_name].target
+    if config_name not in __CONFIG_REGISTRY:
+        return None
+    # replaced, but not (yet) declared
+    function, include_original_function = __CONFIG_REGISTRY[config_name]
+    implementation = functools.partial(function, original_function=None) if include_original_function else function
+    return _awaiting(config_name, implementation) if inspect.iscoroutinefunction(function) else implementation
+
+
+def _current_functions() -> Dict[str, Callable]:
+    """The current implementation of all declared or replaced config functions by config name"""
+    return {config_name: _current_function(config_name)
+            for config_name in {**__CONFIG_REGISTRY, **__ORIG_API_REGISTRY}}
+
+
+def config_names(prefix: str = '') -> List[str]:
+    """The sorted names of all declared or replaced config functions which start with `prefix`
+
+    The names are looked up in a sorted index, which is rebuilt on first use after config functions were
+    declared or replaced under new names, so a namespace is found without scanning all names.
+    """
+    global __NAMES
+    names = __NAMES
+    if names is None:
+        with _registry_lock:
+            if __NAMES is None:
+                __NAMES = sorted({**__CONFIG_REGISTRY, **__ORIG_API_REGISTRY})
+            names = __NAMES
+    if not prefix:
+        return list(names)
+    start = bisect.bisect_left(names, prefix)
+    # all names starting with prefix are smaller than prefix followed by the highest code point
+    return names[start:bisect.bisect_left(names, prefix + '\U0010ffff', start)]
+
+
+def get_namespace(prefix: str) -> Dict[str, Callable]:
+    """The current implementation of all config functions whose names start with `prefix`, sorted by name
+
+    Example:
+    >>> get_namespace('mara_db.')
+    """
+    functions = {}
+    for config_name in config_names(prefix):
+        function = _current_function(config_name)
+        if function is not None:
+            functions[config_name] = function
+    return functions
+
+
+def _async_implementations() -> Dict[str, Callable]:
+    """The current implementations of all declared config functions which are coroutine functions"""
+    implementations = {}
+    for config_name, slot in list(__SLOTS.items()):
+        if config_name in __CONFIG_REGISTRY:
+            function, include_original_function = __CONFIG_REGISTRY[config_name]
+            implementation = (functools.partial(function, original_function=slot.original)
+                              if include_original_function else function)
+        else:
+            function = implementation = slot.original
+        if inspect.iscoroutinefunction(function):
+            implementations[config_name] = implementation
+    return implementations
+
+
+@contextlib.contextmanager
+def override(overrides: Dict[str, Callable] = None, **kwargs: Callable):
+    """Overrides config functions only in the current context (thread, asyncio task or `contextvars.Context`)
+
+    Other threads and tasks keep seeing the replaced functions, nothing is changed globally:
+    >>> with override({'mara_db.host': lambda: 'test-db'}, debug=lambda: True):
+    >>>     run_pipeline_step()
+
+    Overrides don't get the original function passed and bypass cached config values.
+    """
+    overrides = dict(overrides or {}, **kwargs)
+    for config_name, function in overrides.items():
+        assert callable(function), f"Override for '{config_name}' is not callable: {type(function)}"
+    with _registry_lock:
+        for config_name in overrides:
+            _override_counts[config_name] = _override_counts.get(config_name, 0) + 1
+            if _override_counts[config_name] == 1:
+                _rebind(config_name)
+    token = _overrides.set({**(_overrides.get() or {}), **overrides})
+    try:
+        yield
+    finally:
+        _overrides.reset(token)
+        with _registry_lock:
+            for config_name in overrides:
+                _override_counts[config_name] -= 1
+                if not _override_counts[config_name]:
+                    # back to dispatching without looking at the context
+                    del _override_counts[config_name]
+                    _rebind(config_name)
+
+
 @replaceable("mara_default_environment_prefix")
 def default_environment_prefix():
     return os.environ.get('MARA_MARA_BASE__CONFIG_SYSTEM__DEFAULT_ENVIRONMENT_PREFIX', 'MARA')
 
 
-def _bool(value):
-    valid_str = {'true': True, 't': True, '1': True,
-                 'false': False, 'f': False, '0': False,
-                 }
-    lower_value = value.lower()
+@replaceable("mara_base.environment_files")
+def environment_files() -> list:
+    """`.env` files which are read in addition to the environment (the environment wins)"""
+    return ['.env']
+
+
+_INVALID = object()
+"""Returned by the parsers below for values which can't be converted"""
+
+_BOOLS = {'true': True, 't': True, '1': True,
+          'false': False, 'f': False, '0': False}
+
+_INT_RE = re.compile(r'\s*[-+]?\d+\s*')
+_FLOAT_RE = re.compile(r'\s*[-+]?((\d+([.,]\d*)?|[.,]\d+)([eE][-+]?\d+)?|inf|infinity|nan)\s*', re.IGNORECASE)
+
+
+def _parse_bool(value: str):
+    return _BOOLS.get(value.strip().lower(), _INVALID)
+
+
+def _parse_int(value: str):
+    return int(value) if _INT_RE.fullmatch(value) else _INVALID
+
+
+def _parse_float(value: str):
+    # "1,0" is recognized as "1.0"
+    return float(value.replace(',', '.')) if _FLOAT_RE.fullmatch(value) else _INVALID
+
+
+def _parse_json(value: str):
+    try:
+        return json.loads(value)
+    except ValueError:
+        return _INVALID
+
+
+def _parse_untyped(value: str):
+    """Parses a value for a config function without return annotation: float, bool or string"""
+    for parse in (_parse_float, _parse_bool):
+        parsed = parse(value)
+        if parsed is not _INVALID:
+            return parsed
+    return value
+
+
+def _parse(value: str, type_):
+    """Parses `value` into `type_`, returns `_INVALID` if that's not possible"""
+    if type_ is None:
+        return _parse_untyped(value)
+    origin = typing.get_origin(type_) or type_
+    if origin is typing.Union:
+        # e.g. Optional[int]
+        for arg in typing.get_args(type_):
+            if arg is not type(None):
+                parsed = _parse(value, arg)
+                if parsed is not _INVALID:
+                    return parsed
+        return _INVALID
+    if origin is bool:
+        return _parse_bool(value)
+    if origin is int:
+        return _parse_int(value)
+    if origin is float:
+        return _parse_float(value)
+    if origin is str:
+        return value
+    if isinstance(origin, type) and issubclass(origin, pathlib.PurePath):
+        return origin(value)
+    if origin in (list, tuple, set, frozenset):
+        if value.lstrip().startswith('['):
+            parsed = _parse_json(value)
+            return origin(parsed) if isinstance(parsed, list) else _INVALID
+        item_types = typing.get_args(type_)
+        items = [_parse(item.strip(), item_types[0] if item_types else str) for item in value.split(',')] \
+            if value.strip() else []
+        return _INVALID if _INVALID in items else origin(items)
+    # dicts and everything else is expected to be json
+    return _parse_json(value)
+
+
+def _return_type(config_name: str):
+    """The return annotation of a replaceable function, None if it's not declared (yet) or not annotated"""
+    func = _get_original_function(config_name)
+    if func is None or 'return' not in getattr(func, '__annotations__', {}):
+        return None
     try:
-        return valid_str[lower_value]
-    except:
-        raise ValueError('invalid literal for boolean: "%s"' % value)
+        return typing.get_type_hints(func).get('return')
+    except Exception:
+        # unresolvable string annotations
+        return None
 
 
-def _float(input: str) -> float:
-    # workaround for getting "1,0" recognized as "1.0"
-    val = float(input.replace(',', '.'))
-    return val
+def _from_environment(config_name: str, raw_value: str, value=_INVALID) -> Callable:
+    """Returns a replacement function for a config value from the environment
 
+    The value is parsed once, on the first call: the replaced function might not be declared yet when
+    the environment is loaded. Values which don't match the return annotation fall back to the original function.
+    """
+    parsed = [] if value is _INVALID else [value]
+
+    def from_environment(original_function=None):
+        if not parsed:
+            type_ = _return_type(config_name)
+            value = _parse(raw_value, type_)
+            if value is _INVALID:
+                log.error("Invalid value for config '%s' in the environment, expected %s: %r",
+                          config_name, type_, raw_value)
+                value = original_function() if original_function else _parse_untyped(raw_value)
+            parsed.append(value)
+        return parsed[0]
+
+    from_environment.raw_value = raw_value
+    return from_environment
+
+
+def _read_environment_files(paths: List[str]) -> Dict[str, str]:
+    """Reads `KEY=value` lines of `.env` files"""
+    values = {}
+    for path in paths:
+        try:
+            with open(path) as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            continue
+        for line in lines:
+            line = line.strip()
+            if line.startswith('export '):
+                line = line[len('export '):]
+            key, sep, value = line.partition('=')
+            if not sep or line.startswith('#'):
+                continue
+            value = value.strip()
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+                value = value[1:-1]
+            values[key.strip()] = value
+    return values
 
-def add_config_from_environment():
-    """Add configuration from the environment
 
-    This only works for config items which return either strings or numbers (floats).
+def add_config_from_environment():
+    """Add configuration from the environment and `.env` files (see `environment_files`)
 
-    Any environment variable (in lovercase) which starts 'soh_' is turned into
+    Any environment variable (case insensitive) which starts with the prefix 'MARA_' is turned into
     functions which returns the value. The rest of the environment variable name
-    has any '__' replaced by '.'. If the value is a valid float or boolean, it's returned
-    as a float/boolean. Otherwise it's returned as a string.
+    has any '__' replaced by '.'. The values make up the `environment` layer, calling this function again
+    replaces the whole layer.
+
+    The value is parsed into the return annotation of the replaced function: int, float, bool, str,
+    pathlib.Path, lists (comma separated or json) and json for everything else. Without annotation,
+    a valid float or boolean is returned as a float/boolean, otherwise it's returned as a string.
+    Values which don't match the annotation are reported and don't replace the function.
 
     E.g. the following variable
 
-        SOH_PACKAGENAME__CONFIG_ITEM=y
+        MARA_PACKAGENAME__CONFIG_ITEM=y
 
     is equivalent to the following @replace call
 
@@ -139,51 +932,75 @@ def add_config_from_environment():
 
     The prefix can be configured as well, just not from the environment
     """
-    prefix = default_environment_prefix().lower()
-    loaded = False
-    for k in os.environ.keys():
-        key = str(k).lower()
-        if key.startswith(prefix):
-            config_name = key[len(prefix) + 1:].replace('__', '.')
-            value = os.environ[k]
-            try:
-                # try to convert to a number, but just keep the string if it doesn't work
-                value = _float(value)
-            except:
-                try:
-                    value = _bool(value)
-                except:
-                    # we treat it as a string
-                    pass
-            loaded = True
-            replace(config_name, False, lambda: value)
-    if loaded:
+    replacements = _environment_replacements()
+    # variables which are gone from the environment are dropped
+    _replace_layer('environment', replacements)
+    if replacements:
         log.debug("Loaded config from environment")
 
 
+def _environment_replacements() -> Dict[str, _Replacement]:
+    """The replacements of the `environment` layer, reports invalid values"""
+    prefix = default_environment_prefix().lower() + '_'
+    variables = _read_environment_files(environment_files())
+    variables.update(os.environ)
+    errors = []
+    replacements = {}
+    for k, raw_value in variables.items():
+        key = k.lower()
+        if not key.startswith(prefix):
+            continue
+        config_name = key[len(prefix):].replace('__', '.')
+        value = _INVALID
+        if config_name in __ORIG_API_REGISTRY:
+            # already declared: parse now to report all mismatches together
+            type_ = _return_type(config_name)
+            value = _parse(raw_value, type_)
+            if value is _INVALID:
+                errors.append(f'{k}={raw_value!r} (expected {getattr(type_, "__name__", type_)})')
+                continue
+        replacements[config_name] = _Replacement(_from_environment(config_name, raw_value, value), True, k)
+    if errors:
+        log.error("Ignored invalid config values in the environment: %s", ', '.join(errors))
+    return replacements
+
+
+_local_setup_module: str = None
+"""The name of the local_setup module which was loaded by `add_config_from_local_setup_py`"""
+
+
 def add_config_from_local_setup_py():
     # apply environment specific settings (not in git repo)
+    global _local_setup_module
     import importlib
     from ..config import default_app_module
-    parts = default_app_module().split('.')
-    while parts:
-        try:
-            pos_module = '.'.join(parts) + '.local_setup'
+    from ..module_discovery import find_local_setup
+    pos_module = find_local_setup(default_app_module())
+    if pos_module:
+        with _loading_layer('local_setup'):
             importlib.import_module(pos_module)
-            log.debug("Loaded config from local_setup.py at %s", pos_module)
-            return
-        except ModuleNotFoundError:
-            pass
-        parts.pop()
+        _local_setup_module = pos_module
+        log.debug("Loaded config from local_setup.py at %s", pos_module)
+        return
     log.debug("No local_setup.py found.")
     return
 
 
-def print_config():
-    max_len = 0
-    for k, v in get_get_current_config():
-        max_len = max(len(k), max_len)
-    format_str = f'%-{max_len}s -> %s'
-    for k, v in get_get_current_config():
-        f, include_parent = v
-        print(format_str % (k, f()))
+def print_config(format: str = 'text', namespace: str = None):
+    """Prints the current value of all config functions (or of those starting with `namespace`), as text or json"""
+    from .evaluation import evaluate_config
+    results = evaluate_config(names=config_names(namespace) if namespace else None)
+    if format == 'json':
+        print(json.dumps({result.name: {'value': result.value,
+                                        'error': result.error,
+                                        'duration_ms': None if result.duration is None else result.duration * 1000,
+                                        'module': result.module,
+                                        'layer': result.layer,
+                                        'source': result.source}
+                          for result in results}, indent=2, default=repr))
+        return
+    max_len = max((len(result.name) for result in results), default=0)
+    format_str = f'%-{max_len}s -> %s  (%s: %s)'
+    for result in results:
+        print(format_str % (result.name, result.value if result.error is None else f'<{result.error}>',
+                            result.layer, result.source))
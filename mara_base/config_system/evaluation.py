@@ -0,0 +1,198 @@
+"""
+Evaluation of all config functions for the config view and `mara print-config`
+
+The config functions are called in parallel on a long-lived pool of daemon threads. Functions which did not
+return within a timeout after they started are reported as timed out, so a single slow function (e.g. one
+resolving a secret or a DNS name) doesn't block everything else. A function is not called again while a
+previous call still runs, and when all threads are taken by such calls, the remaining functions are reported
+as not evaluated. Results are cached for a short time, so repeated page loads don't call every function again.
+"""
+
+import contextvars
+import os
+import queue
+import threading
+import time
+import traceback
+import typing
+
+from . import replaceable, config_generation, _current_function, _current_functions, _get_original_function, \
+    get_provenance
+
+
+class ConfigValue(typing.NamedTuple):
+    """The result of calling a config function"""
+    name: str
+    value: typing.Any
+    error: str
+    """None if the function returned a value"""
+    duration: float
+    """Seconds the function took, None if it timed out"""
+    module: str
+    doc: str
+    layer: str
+    """The config layer which supplied the implementation"""
+    source: str
+    """module.name of the implementation, or the environment variable"""
+
+
+@replaceable('mara_base.config_evaluation_timeout')
+def config_evaluation_timeout() -> float:
+    """Seconds after which the config view and print-config give up waiting for config functions"""
+    return 2.0
+
+
+@replaceable('mara_base.config_evaluation_workers')
+def config_evaluation_workers() -> int:
+    """How many config functions are evaluated in parallel for the config view and print-config"""
+    return 8
+
+
+@replaceable('mara_base.config_evaluation_max_age')
+def config_evaluation_max_age() -> float:
+    """Seconds for which the evaluated config values are reused by the config view and print-config"""
+    return 5.0
+
+
+_calls = queue.SimpleQueue()
+"""The calls for the worker threads: config name, function, context, start times and results of the evaluation"""
+
+_workers: [threading.Thread] = []
+
+_running: {str: float} = {}
+"""When the currently running calls started (time.monotonic) by config name, across evaluations"""
+
+_lock = threading.Lock()
+
+
+def _after_fork_in_child():
+    """The worker threads don't exist in forked processes"""
+    global _calls, _workers, _running, _lock
+    _calls, _workers, _running, _lock = queue.SimpleQueue(), [], {}, threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _work():
+    while True:
+        config_name, function, context, starts, finished = _calls.get()
+        if starts is None:
+            # the evaluation was given up before the call started
+            continue
+        # the same bookkeeping on both ends of the call, even if the pool is reset meanwhile (e.g. in tests)
+        running, lock = _running, _lock
+        with lock:
+            if config_name in running:
+                finished.put((config_name, None, 'Still running', None))
+                continue
+            start = running[config_name] = time.monotonic()
+        starts[config_name] = start
+        try:
+            value, error = context.run(function), None
+        except Exception as e:
+            value, error = None, ''.join(traceback.format_exception_only(type(e), e)).strip()
+        finally:
+            with lock:
+                del running[config_name]
+        finished.put((config_name, value, error, time.monotonic() - start))
+
+
+def _start_workers(count: int):
+    """Makes sure that `count` worker threads exist. They are daemons, so stuck calls don't block the exit"""
+    with _lock:
+        while len(_workers) < count:
+            thread = threading.Thread(target=_work, name=f'mara-config-{len(_workers)}', daemon=True)
+            thread.start()
+            _workers.append(thread)
+
+
+_last_evaluation: (float, int, [ConfigValue], {str: ConfigValue}) = None
+"""When the config was evaluated last (time.monotonic), the config generation and the results (also by name)"""
+
+
+def _describe(config_name: str, function: typing.Callable) -> (str, str, str, str):
+    """The module, the doc string and the provenance of a config function"""
+    documented = _get_original_function(config_name) or function
+    return (getattr(documented, '__module__', None) or '<no_module>',
+            getattr(documented, '__doc__', None) or '',
+            *get_provenance(config_name))
+
+
+def evaluate_config(max_age: float = None, names: typing.Iterable[str] = None) -> [ConfigValue]:
+    """Calls all config functions (or only those in `names`) in parallel, returns their values sorted by name
+
+    Results which are younger than `max_age` seconds (Default: `config_evaluation_max_age()`) are reused,
+    unless config functions were replaced since then.
+    """
+    global _last_evaluation
+    max_age = config_evaluation_max_age() if max_age is None else max_age
+    last_evaluation = _last_evaluation
+    generation = config_generation()
+    if (last_evaluation is not None and time.monotonic() - last_evaluation[0] < max_age
+            and last_evaluation[1] == generation):
+        if names is None:
+            return last_evaluation[2]
+        by_name = last_evaluation[3]
+        return sorted((by_name[name] for name in set(names) if name in by_name), key=lambda result: result.name)
+
+    if names is None:
+        functions = _current_functions()
+    else:
+        functions = {name: function for name, function in ((name, _current_function(name)) for name in names)
+                     if function is not None}
+
+    timeout = config_evaluation_timeout()
+    _start_workers(config_evaluation_workers())
+    results = {}
+    starts = {}
+    finished = queue.SimpleQueue()
+    calls = []
+    with _lock:
+        running = dict(_running)
+    for config_name, function in functions.items():
+        if config_name in running:
+            results[config_name] = ConfigValue(
+                config_name, None, f'Still running since {time.monotonic() - running[config_name]:.1f} seconds',
+                None, *_describe(config_name, function))
+        else:
+            # each call sees the overrides of the caller's context
+            call = [config_name, function, contextvars.copy_context(), starts, finished]
+            calls.append(call)
+            _calls.put(call)
+
+    pending = {config_name: functions[config_name] for config_name, *_ in calls}
+    while pending:
+        now = time.monotonic()
+        for config_name in [name for name in pending if name in starts and now - starts[name] > timeout]:
+            # the thread can't be stopped, the result is just not waited for
+            results[config_name] = ConfigValue(config_name, None, f'Timed out after {timeout} seconds', None,
+                                               *_describe(config_name, pending.pop(config_name)))
+        with _lock:
+            stuck = sum(1 for start in _running.values() if now - start > timeout)
+            threads = len(_workers)
+        if pending and stuck >= threads and not any(name in starts for name in pending):
+            # all threads are taken by calls which don't return
+            break
+        deadlines = [starts[name] + timeout for name in pending if name in starts]
+        try:
+            config_name, value, error, duration = finished.get(
+                timeout=max(min(deadlines, default=now + min(timeout, 0.05)) - now, 0))
+        except queue.Empty:
+            continue
+        if config_name in pending:
+            results[config_name] = ConfigValue(config_name, value, error, duration,
+                                               *_describe(config_name, pending.pop(config_name)))
+
+    for call in calls:
+        # calls which did not start yet are skipped by the workers
+        call[3] = None
+    for config_name, function in pending.items():
+        results[config_name] = ConfigValue(config_name, None, 'Not evaluated, all threads are busy', None,
+                                           *_describe(config_name, function))
+    results = list(results.values())
+
+    results.sort(key=lambda result: result.name)
+    if names is None:
+        _last_evaluation = (time.monotonic(), generation, results, {result.name: result for result in results})
+    return results
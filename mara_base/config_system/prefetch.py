@@ -0,0 +1,72 @@
+"""
+Concurrent resolution of async config functions
+
+Config functions (or their replacements) can be coroutine functions, e.g. to ask a secrets agent or a
+metadata endpoint. Called synchronously, each of them runs to completion in its own event loop and its result
+is kept until the function is replaced. `prefetch_config()` resolves all of them at once at startup, so that
+slow providers wait in parallel and later calls don't wait at all.
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+import typing
+
+from .. import config_system
+from . import replaceable, _async_implementations, _async_results, _run_sync
+
+log = logging.getLogger(__name__)
+
+
+@replaceable('mara_base.config_prefetch_timeout')
+def config_prefetch_timeout() -> float:
+    """Seconds after which the prefetching of an async config function is given up"""
+    return 5.0
+
+
+def _without_arguments(function: typing.Callable) -> bool:
+    try:
+        return all(parameter.default is not parameter.empty or parameter.kind in (parameter.VAR_POSITIONAL,
+                                                                                  parameter.VAR_KEYWORD)
+                   for parameter in inspect.signature(function).parameters.values())
+    except (TypeError, ValueError):
+        return False
+
+
+async def prefetch(timeout: float = None) -> typing.Dict[str, str]:
+    """Resolves all async config functions which can be called without arguments concurrently
+
+    Returns the errors (including timeouts) by config name. Functions which failed are called again on
+    their next call.
+    """
+    timeout = config_prefetch_timeout() if timeout is None else timeout
+    implementations = {config_name: function for config_name, function in _async_implementations().items()
+                       if _without_arguments(function)}
+    if not implementations:
+        return {}
+    start = time.monotonic()
+    results = await asyncio.gather(*[asyncio.wait_for(function(), timeout) for function in implementations.values()],
+                                   return_exceptions=True)
+    errors = {}
+    with config_system._registry_lock:
+        current = _async_implementations()
+        for (config_name, function), result in zip(implementations.items(), results):
+            if isinstance(result, BaseException):
+                errors[config_name] = (f'Timed out after {timeout} seconds' if isinstance(result, asyncio.TimeoutError)
+                                       else f'{type(result).__name__}: {result}')
+            elif getattr(current.get(config_name), 'func', current.get(config_name)) \
+                    is getattr(function, 'func', function):
+                # not replaced in the meantime
+                _async_results.setdefault(config_name, {})[()] = result
+    log.debug("Prefetched %s async config functions in %.1f ms", len(implementations),
+              (time.monotonic() - start) * 1000)
+    if errors:
+        log.warning("Could not prefetch config: %s",
+                    ', '.join(f'{config_name} ({error})' for config_name, error in errors.items()))
+    return errors
+
+
+def prefetch_config(timeout: float = None) -> typing.Dict[str, str]:
+    """Synchronous version of `prefetch`, also works when called from a running event loop"""
+    return _run_sync(prefetch(timeout))
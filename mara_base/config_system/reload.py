@@ -0,0 +1,214 @@
+"""
+Hot reload of local_setup.py and `.env` files
+
+`start_watching()` starts a thread which re-resolves local_setup.py and the `.env` files (see
+`environment_files`) when one of them changes. The differences are applied to the config registry in one
+step, so config functions either see the old or the new config, and `config_generation()` is bumped.
+The thread waits for changes with inotify on Linux and falls back to checking the modification times.
+"""
+
+import contextlib
+import ctypes
+import ctypes.util
+import importlib
+import logging
+import os
+import select
+import sys
+import threading
+import time
+import typing
+
+from .. import cache_files
+from . import (replaceable, environment_files, add_config_from_local_setup_py, _environment_replacements, _get_layer,
+               _replace_layers, _staged, _loading_layer)
+
+log = logging.getLogger(__name__)
+
+
+@replaceable('mara_base.watch_config')
+def watch_config() -> bool:
+    """Whether `mara` reloads the config when local_setup.py or a `.env` file changes"""
+    return False
+
+
+@replaceable('mara_base.watch_config_interval')
+def watch_config_interval() -> float:
+    """Seconds between two checks of the config files when inotify is not available"""
+    return 1.0
+
+
+# inotify(7)
+_IN_MODIFY = 0x2
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+
+_thread: threading.Thread = None
+_stop_pipe: (int, int) = None
+
+
+def _after_fork_in_child():
+    """The watcher thread doesn't exist in forked processes"""
+    global _thread, _stop_pipe
+    _thread = None
+    _stop_pipe = None
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _local_setup_file() -> str:
+    from . import _local_setup_module
+    return getattr(sys.modules.get(_local_setup_module), '__file__', None)
+
+
+def watched_files() -> [str]:
+    """The absolute paths of local_setup.py and of the `.env` files"""
+    files = [os.path.abspath(path) for path in environment_files()]
+    local_setup_file = _local_setup_file()
+    if local_setup_file:
+        files.append(os.path.abspath(local_setup_file))
+    return files
+
+
+def _import_local_setup() -> typing.Optional[str]:
+    """Imports (again) the local_setup module, returns its name"""
+    from .. import config_system
+    if config_system._local_setup_module in sys.modules:
+        with _loading_layer('local_setup'):
+            importlib.reload(sys.modules[config_system._local_setup_module])
+    else:
+        # e.g. the config was loaded from a snapshot
+        add_config_from_local_setup_py()
+    return config_system._local_setup_module
+
+
+def reload_config() -> [str]:
+    """Re-resolves local_setup.py and the `.env` files, returns the names of the changed config functions
+
+    When local_setup.py raises, nothing is changed.
+    """
+    start = time.perf_counter()
+    staged = {}
+    token = _staged.set(staged)
+    try:
+        local_setup_module = _import_local_setup()
+    except Exception:
+        log.exception("Reloading local_setup.py failed, keeping the current config")
+        return []
+    finally:
+        _staged.reset(token)
+
+    layers = {}
+    for layer, replacements in staged.items():
+        if layer == 'local_setup':
+            # replacements of modules which were not executed again stay
+            replacements = {**{config_name: replacement
+                               for config_name, replacement in _get_layer(layer).items()
+                               if getattr(replacement.function, '__module__', None)
+                               not in (local_setup_module, 'mara_base.config_system.snapshot')},
+                            **replacements}
+        else:
+            replacements = {**_get_layer(layer), **replacements}
+        layers[layer] = replacements
+    layers['environment'] = _environment_replacements()
+    changed = _replace_layers(layers)
+    duration = (time.perf_counter() - start) * 1000
+    if changed:
+        log.info("Reloaded config in %.1f ms, changed: %s", duration, ', '.join(changed))
+    else:
+        log.debug("Reloaded config in %.1f ms, nothing changed", duration)
+    return changed
+
+
+_libc = None
+
+
+def _inotify() -> typing.Optional[int]:
+    """A new inotify file descriptor, None if inotify is not available"""
+    global _libc
+    try:
+        if _libc is None:
+            _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = _libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError, TypeError):
+        return None
+    return fd if fd >= 0 else None
+
+
+def _watch_directories(inotify_fd: int, files: [str]) -> bool:
+    """Adds inotify watches for the directories of `files`, returns whether that worked"""
+    for directory in sorted({os.path.dirname(path) for path in files}):
+        # editors often replace files instead of writing them, so the directories are watched
+        if os.path.isdir(directory) and _libc.inotify_add_watch(
+                inotify_fd, os.fsencode(directory),
+                _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE) < 0:
+            log.debug("Could not watch %s with inotify: %s", directory, os.strerror(ctypes.get_errno()))
+            return False
+    return True
+
+
+def _watch(files: [str], mtimes: {str: int}, inotify_fd: typing.Optional[int], stop_fd: int, interval: float):
+    while True:
+        readable, _, _ = select.select([stop_fd] + ([inotify_fd] if inotify_fd is not None else []), [], [],
+                                       None if inotify_fd is not None else interval)
+        if stop_fd in readable:
+            break
+        if inotify_fd in readable:
+            with contextlib.suppress(BlockingIOError):
+                while os.read(inotify_fd, 65536):
+                    pass
+            # let editors finish writing
+            time.sleep(0.05)
+        current_mtimes = cache_files.file_mtimes(files)
+        if current_mtimes == mtimes:
+            continue
+        mtimes = current_mtimes
+        try:
+            reload_config()
+        except Exception:
+            log.exception("Reloading the config failed")
+        # local_setup.py might not have existed before
+        new_files = watched_files()
+        if set(new_files) != set(files):
+            files = new_files
+            mtimes = cache_files.file_mtimes(files)
+            if inotify_fd is not None and not _watch_directories(inotify_fd, files):
+                os.close(inotify_fd)
+                inotify_fd = None
+    if inotify_fd is not None:
+        os.close(inotify_fd)
+    os.close(stop_fd)
+
+
+def start_watching(interval: float = None):
+    """Starts reloading the config when local_setup.py or a `.env` file changes"""
+    global _thread, _stop_pipe
+    if _thread is not None:
+        return
+    files = watched_files()
+    inotify_fd = _inotify()
+    if inotify_fd is not None and not _watch_directories(inotify_fd, files):
+        os.close(inotify_fd)
+        inotify_fd = None
+    _stop_pipe = os.pipe()
+    _thread = threading.Thread(target=_watch, name='mara-config-watcher', daemon=True,
+                               args=(files, cache_files.file_mtimes(files), inotify_fd, _stop_pipe[0],
+                                     watch_config_interval() if interval is None else interval))
+    _thread.start()
+    log.debug("Watching %s for config changes (%s)", ', '.join(files),
+              'inotify' if inotify_fd is not None else 'polling')
+
+
+def stop_watching():
+    """Stops the thread started by `start_watching`"""
+    global _thread, _stop_pipe
+    if _thread is None:
+        return
+    os.write(_stop_pipe[1], b'x')
+    _thread.join()
+    os.close(_stop_pipe[1])
+    _thread = None
+    _stop_pipe = None
@@ -0,0 +1,268 @@
+"""
+Config values shared between processes, e.g. the workers of a prefork web server
+
+After `share_config()` (in the master process, before the workers are forked), the resolved values of all
+config functions without parameters which return a scalar (str, int, float, bool or None) are published to a
+memory mapped file. Whenever such a config function is replaced in any of the processes, its new value is
+published as well. Each call of a config function first compares the generation counter of the shared
+memory with the last one seen by the process, only when it changed, the published values are read and
+applied as the `shared` config layer. There is no IPC on the read path.
+"""
+
+import atexit
+import contextlib
+import fcntl
+import inspect
+import itertools
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import typing
+
+from .. import config_system
+from . import replaceable, _Replacement, _current_functions, _get_original_function, \
+    _replace_layer, _run_sync, _set_sharing, _unshared_function
+
+log = logging.getLogger(__name__)
+
+
+@replaceable('mara_base.shared_config_size')
+def shared_config_size() -> int:
+    """The size in bytes of the memory mapped file with the shared config values"""
+    return 1024 * 1024
+
+
+_HEADER = struct.Struct('<QQ')
+"""The generation (odd while being written) and the length of the json data which follows"""
+
+_GENERATION = struct.Struct('<Q')
+
+
+class _Region:
+    """A memory mapped file with json data, written under a file lock and read lock-free (a seqlock)"""
+
+    def __init__(self, path: str, size: int, create: bool):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | (os.O_CREAT if create else 0), 0o600)
+        if create:
+            os.ftruncate(self.fd, size)
+        self.mmap = mmap.mmap(self.fd, os.fstat(self.fd).st_size)
+        self.words = memoryview(self.mmap)[:8].cast('Q')
+        """The generation as an integer array, for cheap checks"""
+        self.lock = threading.Lock()
+        self.creator = None
+        """The pid of the process which created the file"""
+
+    def generation(self) -> int:
+        return _GENERATION.unpack_from(self.mmap, 0)[0]
+
+    def read(self) -> (int, dict):
+        """The generation and the data"""
+        for attempt in itertools.count():
+            generation, length = _HEADER.unpack_from(self.mmap, 0)
+            if generation % 2 == 0:
+                data = self.mmap[_HEADER.size:_HEADER.size + length]
+                if self.generation() == generation:
+                    return generation, json.loads(data) if length else {}
+            elif attempt >= 100:
+                # writers hold the file lock while the generation is odd: waiting for the lock either waits
+                # for the write to finish or, when the writer died while writing, allows repairing the data
+                with self._locked():
+                    self._repair()
+
+    def _repair(self):
+        """Makes the generation even again after a writer died while writing, only called with the file lock"""
+        generation, length = _HEADER.unpack_from(self.mmap, 0)
+        if generation % 2 == 0:
+            return
+        try:
+            data = json.loads(self.mmap[_HEADER.size:_HEADER.size + length]) if length else {}
+        except ValueError:
+            data = {}
+        log.warning("A process died while writing to %s, %s shared config values are kept",
+                    self.path, len(data))
+        self._write(generation - 1, data)
+
+    def _write(self, generation: int, data: dict):
+        """Replaces the data of the (even) `generation`, only called with the file lock"""
+        encoded = json.dumps(data, separators=(',', ':')).encode()
+        if _HEADER.size + len(encoded) > len(self.mmap):
+            raise ValueError(f'{len(encoded)} bytes of shared config values don\'t fit into {self.path}, '
+                             f'see mara_base.shared_config_size')
+        _GENERATION.pack_into(self.mmap, 0, generation + 1)
+        self.mmap[_HEADER.size:_HEADER.size + len(encoded)] = encoded
+        _HEADER.pack_into(self.mmap, 0, generation + 2, len(encoded))
+
+    @contextlib.contextmanager
+    def _locked(self):
+        # lockf locks are per process, the threads of a process are serialized by `lock`
+        with self.lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN)
+
+    def update(self, entries: dict, removed: typing.Iterable[str]):
+        """Adds `entries` to the data and removes the keys in `removed`"""
+        with self._locked():
+            self._repair()
+            generation, data = self.read()
+            data.update(entries)
+            for key in removed:
+                data.pop(key, None)
+            self._write(generation, data)
+
+
+_region: _Region = None
+_seen_generation: int = None
+"""The generation of the shared values which are applied in this process"""
+
+_applied: {str: (tuple, _Replacement)} = {}
+"""The applied shared values and their replacements by config name"""
+
+
+def _after_fork_in_child():
+    """The lock might have been held by another thread of the parent while forking"""
+    if _region is not None:
+        _region.lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _shared_value(value) -> typing.Callable:
+    def shared_config():
+        return value
+
+    return shared_config
+
+
+def _checker(region: _Region) -> typing.Callable[[], bool]:
+    words = region.words
+
+    def check() -> bool:
+        """Applies the values published by other processes, returns whether there were new ones"""
+        if words[0] == _seen_generation:
+            return False
+        _apply()
+        return True
+
+    return check
+
+
+def _apply():
+    global _seen_generation, _applied
+    with config_system._registry_lock:
+        generation, values = _region.read()
+        if generation == _seen_generation:
+            return
+        applied = {}
+        for config_name, entry in values.items():
+            entry = tuple(entry)
+            previous = _applied.get(config_name)
+            if previous is not None and previous[0] == entry:
+                applied[config_name] = previous
+            else:
+                value, source, pid = entry
+                applied[config_name] = (entry, _Replacement(_shared_value(value), False,
+                                                            f'{source} (process {pid})'))
+        config_system._applying_shared = True
+        try:
+            _replace_layer('shared', {config_name: replacement
+                                      for config_name, (_, replacement) in applied.items()})
+        finally:
+            config_system._applying_shared = False
+        _applied = applied
+        _seen_generation = generation
+
+
+def _shareable(config_name: str) -> bool:
+    """Whether the config function is declared and has no parameters"""
+    original = _get_original_function(config_name)
+    try:
+        return original is not None and not inspect.signature(original).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def _publish(config_names: typing.Iterable[str]):
+    """Publishes the values of `config_names` in this process (not counting the shared layer)"""
+    entries = {}
+    removed = []
+    for config_name in config_names:
+        value = None
+        shareable = _shareable(config_name)
+        if shareable:
+            function, (layer, source) = _unshared_function(config_name)
+            try:
+                value = function()
+                if inspect.iscoroutine(value):
+                    value = _run_sync(value)
+            except Exception:
+                shareable = False
+            shareable = shareable and isinstance(value, (str, int, float, bool, type(None)))
+        if shareable:
+            entries[config_name] = [value, source or layer, os.getpid()]
+        else:
+            # the other processes fall back to their own implementation
+            removed.append(config_name)
+    try:
+        _region.update(entries, removed)
+    except ValueError as e:
+        log.error("Could not share config values: %s", e)
+
+
+def share_config(path: str = None) -> str:
+    """Shares config values with all processes forked from now on, returns the path of the shared memory
+
+    When `path` points to the shared memory of another process, its values are used (and changed values of
+    this process are published to it). Otherwise the values of this process are published first.
+    """
+    global _region
+    if _region is not None:
+        return _region.path
+    create = path is None or not os.path.exists(path)
+    if path is None:
+        directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        path = os.path.join(directory, f'mara-config-{os.getpid()}')
+    _region = _Region(path, shared_config_size(), create)
+    if create:
+        _region.creator = os.getpid()
+        atexit.register(_unlink, _region)
+    with config_system._registry_lock:
+        if create:
+            _publish(list(_current_functions()))
+        check = _checker(_region)
+        _set_sharing(check, _publish)
+        check()
+    log.debug("Sharing config values in %s", path)
+    return path
+
+
+def _unlink(region: _Region):
+    if region.creator == os.getpid() and os.path.exists(region.path):
+        os.unlink(region.path)
+
+
+def stop_sharing():
+    """Stops sharing config values, the values of other processes are not used anymore"""
+    global _region, _seen_generation, _applied
+    if _region is None:
+        return
+    with config_system._registry_lock:
+        _set_sharing(None, None)
+        config_system._applying_shared = True
+        try:
+            _replace_layer('shared', {})
+        finally:
+            config_system._applying_shared = False
+    _region.words.release()
+    _region.mmap.close()
+    os.close(_region.fd)
+    _unlink(_region)
+    _region, _seen_generation, _applied = None, None, {}
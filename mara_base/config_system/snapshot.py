@@ -0,0 +1,110 @@
+"""
+Frozen config snapshots for fast cold starts
+
+`mara config freeze` writes the resolved values of all config functions replaced by packages, local_setup.py
+or the environment to a snapshot file. When `$MARA_CONFIG_SNAPSHOT` points to such a file and neither
+local_setup.py, the environment variables with the config prefix nor the installed packages changed since
+then, `mara` replaces the config functions with the frozen values instead of importing local_setup.py and
+scanning the environment. Replacements of the `cli`, `shared` and `runtime` layers are not frozen.
+"""
+
+import inspect
+import logging
+import os
+import sys
+import typing
+
+from .. import cache_files
+from . import (default_environment_prefix, environment_files, _get_layer, _get_original_function, _replace,
+               _Replacement, _run_sync)
+
+log = logging.getLogger(__name__)
+
+FROZEN_LAYERS = ('package', 'local_setup', 'environment')
+"""The layers which are frozen, replacements in the `cli`, `shared` and `runtime` layers only apply to a process"""
+
+
+def _fingerprint(local_setup_file: str) -> dict:
+    from ..config import default_app_module
+    from ..module_discovery import find_local_setup
+    return {'mara_app': default_app_module(),
+            'local_setup_module': find_local_setup(default_app_module()),
+            'local_setup': cache_files.file_mtimes([local_setup_file] if local_setup_file else []),
+            'environment_files': cache_files.file_mtimes(environment_files()),
+            'environment': cache_files.environment_hash(default_environment_prefix() + '_',
+                                                       exclude=['MARA_CONFIG_SNAPSHOT', 'MARA_CONFIG_STATISTICS']),
+            'installed_packages': cache_files.installed_packages_mtimes()}
+
+
+def freeze_config(path: str) -> [str]:
+    """Writes the values of all config functions replaced in `FROZEN_LAYERS` to a snapshot file
+
+    Returns the names of the config functions which could not be frozen (they take arguments, raise or
+    return something which is not json). A snapshot with such functions is not used at startup.
+    """
+    from . import _local_setup_module
+    values = {}
+    not_frozen = []
+    replacements = {}
+    for layer in FROZEN_LAYERS:
+        # a higher layer wins
+        replacements.update({config_name: (layer, replacement)
+                             for config_name, replacement in _get_layer(layer).items()})
+    for config_name, (layer, replacement) in replacements.items():
+        try:
+            if replacement.include_original_function:
+                value = replacement.function(original_function=_get_original_function(config_name))
+            else:
+                value = replacement.function()
+            if inspect.iscoroutine(value):
+                value = _run_sync(value)
+        except Exception:
+            not_frozen.append(config_name)
+            continue
+        if not _is_json(value):
+            not_frozen.append(config_name)
+            continue
+        values[config_name] = {'value': value, 'layer': layer, 'source': replacement.source}
+    local_setup_file = getattr(sys.modules.get(_local_setup_module), '__file__', None)
+    cache_files.write_json(path, {'fingerprint': _fingerprint(local_setup_file),
+                                  'local_setup_file': local_setup_file,
+                                  'complete': not not_frozen,
+                                  'values': values})
+    return not_frozen
+
+
+def _is_json(value) -> bool:
+    """Whether `value` survives a json round trip unchanged"""
+    if isinstance(value, list):
+        return all(_is_json(item) for item in value)
+    if isinstance(value, dict):
+        return all(isinstance(k, str) and _is_json(v) for k, v in value.items())
+    return isinstance(value, (str, int, float, bool, type(None)))
+
+
+def _frozen(value) -> typing.Callable:
+    def frozen_config():
+        return value
+
+    return frozen_config
+
+
+def load_config_snapshot(path: str) -> bool:
+    """Replaces the config functions with the values of a still valid snapshot, returns whether it was used"""
+    snapshot = cache_files.read_json(path) if path else None
+    if not snapshot:
+        return False
+    if not snapshot.get('complete') or snapshot.get('fingerprint') != _fingerprint(snapshot.get('local_setup_file')):
+        log.debug("Config snapshot %s is outdated", path)
+        return False
+    for config_name, entry in snapshot['values'].items():
+        # each value goes back into its layer, so replacements in higher layers still win
+        _replace(config_name, _Replacement(_frozen(entry['value']), False, entry['source']), entry['layer'])
+    log.debug("Loaded config from snapshot %s", path)
+    return True
+
+
+def config_snapshot_path() -> str:
+    """The snapshot which is used at startup (Default: $MARA_CONFIG_SNAPSHOT)"""
+    # not a replaceable function: it is needed before local_setup.py is loaded
+    return os.environ.get('MARA_CONFIG_SNAPSHOT')
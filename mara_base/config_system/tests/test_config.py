@@ -1,4 +1,6 @@
-from .. import replace, replaceable, add_config_from_environment, _reset_config
+from .. import replace, replaceable, add_config_from_environment, _reset_config, override, overlay
+import typing
+
 import pytest
 
 
@@ -19,14 +21,13 @@ orig_without_args = without_args
 
 @pytest.fixture()
 def setup_config():
-    """Setup a clean config and insert a single API"""
-    _reset_config()
-    global something
-    global without_args
-    something = replaceable(orig_something)
-    without_args = replaceable(orig_without_args)
-    yield setup_config
-    _reset_config()
+    """Insert a single API, all config changes of a test are undone afterwards"""
+    with overlay():
+        global something
+        global without_args
+        something = replaceable(orig_something)
+        without_args = replaceable(orig_without_args)
+        yield setup_config
 
 
 # use it in every tests in this file
@@ -107,3 +108,282 @@ def test_add_config_from_environment():
     add_config_from_environment()
 
     assert 'y' == without_args()
+
+
+def test_replace_rebinds_declared_function():
+    @replaceable('test.rebind')
+    def _tester() -> str:
+        return 'x'
+
+    replace('test.rebind', function=lambda: 'y')
+    assert 'y' == _tester()
+
+    _reset_config()
+    assert 'x' == _tester()
+
+
+def test_replace_before_declaration():
+    replace('test.replaced_early', function=lambda: 'y')
+
+    @replaceable('test.replaced_early')
+    def _tester() -> str:
+        return 'x'
+
+    assert 'y' == _tester()
+
+
+def test_cached_replaceable_invalidated_by_dependencies():
+    calls = []
+
+    @replaceable('test.host')
+    def host() -> str:
+        return 'localhost'
+
+    @replaceable('test.port', cache=True)
+    def port() -> int:
+        return 5432
+
+    @replaceable('test.unrelated')
+    def unrelated() -> str:
+        return 'x'
+
+    @replaceable('test.connection_string', cache=True)
+    def connection_string() -> str:
+        calls.append(1)
+        return f'{host()}:{port()}'
+
+    assert 'localhost:5432' == connection_string()
+    assert 'localhost:5432' == connection_string()
+    assert 1 == len(calls)
+
+    replace('test.unrelated', function=lambda: 'y')
+    assert 'localhost:5432' == connection_string()
+    assert 1 == len(calls)
+
+    replace('test.host', function=lambda: 'db')
+    assert 'db:5432' == connection_string()
+    assert 2 == len(calls)
+
+    # invalidation is transitive through the cached port value
+    replace('test.port', function=lambda: 1234)
+    assert 'db:1234' == connection_string()
+    assert 3 == len(calls)
+
+
+def test_add_config_from_environment_parses_return_annotation(monkeypatch, tmp_path):
+    @replaceable('test.port')
+    def port() -> int:
+        return 1
+
+    @replaceable('test.ratio')
+    def ratio() -> float:
+        return 0.5
+
+    @replaceable('test.hosts')
+    def hosts() -> typing.List[str]:
+        return []
+
+    @replaceable('test.untyped')
+    def untyped():
+        return None
+
+    (tmp_path / '.env').write_text('# comment\nexport MARA_TEST__HOSTS="a, b"\nMARA_TEST__RATIO=1\n')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('MARA_TEST__PORT', '5432')
+    monkeypatch.setenv('MARA_TEST__RATIO', '1,5')
+    monkeypatch.setenv('MARA_TEST__UNTYPED', 'true')
+    add_config_from_environment()
+
+    assert 5432 == port()
+    assert 1.5 == ratio()
+    assert ['a', 'b'] == hosts()
+    assert untyped() is True
+
+
+def test_add_config_from_environment_reports_mismatches(monkeypatch, caplog):
+    @replaceable('test.port')
+    def port() -> int:
+        return 1
+
+    @replaceable('test.enabled')
+    def enabled() -> bool:
+        return False
+
+    monkeypatch.setenv('MARA_TEST__PORT', 'not a number')
+    monkeypatch.setenv('MARA_TEST__ENABLED', 'maybe')
+    add_config_from_environment()
+
+    assert 1 == port()
+    assert enabled() is False
+    errors = [record.getMessage() for record in caplog.records if record.levelname == 'ERROR']
+    assert 1 == len(errors)
+    assert 'MARA_TEST__PORT' in errors[0] and 'MARA_TEST__ENABLED' in errors[0]
+
+
+def test_add_config_from_environment_before_declaration(monkeypatch):
+    monkeypatch.setenv('MARA_TEST__LATE_PORT', '42')
+    monkeypatch.setenv('MARA_TEST__LATE_NAME', '43')
+    add_config_from_environment()
+
+    @replaceable('test.late_port')
+    def late_port() -> int:
+        return 1
+
+    @replaceable('test.late_name')
+    def late_name() -> str:
+        return ''
+
+    assert 42 == late_port()
+    assert '43' == late_name()
+
+
+def test_override_is_context_local():
+    import threading
+
+    @replaceable('test.host')
+    def host() -> str:
+        return 'localhost'
+
+    @replaceable('test.url', cache=True)
+    def url() -> str:
+        return f'db://{host()}'
+
+    seen_in_thread = []
+    with override({'test.host': lambda: 'test-db'}):
+        assert 'test-db' == host()
+        assert 'db://test-db' == url()
+        thread = threading.Thread(target=lambda: seen_in_thread.append((host(), url())))
+        thread.start()
+        thread.join()
+
+    assert [('localhost', 'db://localhost')] == seen_in_thread
+    assert 'localhost' == host()
+    assert 'db://localhost' == url()
+
+
+def test_call_statistics():
+    from .. import enable_call_statistics, disable_call_statistics, get_call_statistics
+
+    @replaceable('test.counted')
+    def counted() -> int:
+        return 1
+
+    def replacement() -> int:
+        return 2
+
+    enable_call_statistics()
+    try:
+        counted()
+        replace('test.counted', function=replacement)
+        counted()
+        counted()
+        statistics = [statistic for statistic in get_call_statistics() if statistic.config_name == 'test.counted']
+    finally:
+        disable_call_statistics()
+
+    assert [2, 1] == [statistic.calls for statistic in statistics]
+    assert statistics[0].implementation.endswith('test_call_statistics.<locals>.replacement')
+    assert all(statistic.mean_duration >= 0 for statistic in statistics)
+    assert [] == get_call_statistics()
+
+
+def test_higher_layers_win_regardless_of_order(monkeypatch):
+    from .. import get_provenance
+
+    @replaceable('test.host')
+    def host() -> str:
+        return 'localhost'
+
+    assert ('defaults', f'{__name__}.test_higher_layers_win_regardless_of_order.<locals>.host') \
+           == get_provenance('test.host')
+
+    monkeypatch.setenv('MARA_TEST__HOST', 'from-env')
+    add_config_from_environment()
+    replace('test.host', function=lambda: 'from-package')
+    assert 'from-env' == host()
+    assert ('environment', 'MARA_TEST__HOST') == get_provenance('test.host')
+
+    replace('test.host', function=lambda: 'at-runtime', layer='runtime')
+    assert 'at-runtime' == host()
+    assert 'runtime' == get_provenance('test.host').layer
+
+    # reloading the environment replaces the whole layer
+    monkeypatch.delenv('MARA_TEST__HOST')
+    replace('test.host', function=lambda: 'from-local-setup', layer='local_setup')
+    add_config_from_environment()
+    assert 'at-runtime' == host()
+
+    from .. import _replace_layer
+    _replace_layer('runtime', {})
+    assert 'from-local-setup' == host()
+    assert 'local_setup' == get_provenance('test.host').layer
+
+
+def test_overlay_undoes_replacements_and_keeps_declarations():
+    @replaceable('test.host')
+    def host() -> str:
+        return 'localhost'
+
+    replace('test.host', function=lambda: 'outer')
+    with overlay():
+        replace('test.host', function=lambda: 'inner')
+        replace('test.host', function=lambda: 'at-runtime', layer='runtime')
+
+        @replaceable('test.declared_in_overlay')
+        def declared_in_overlay() -> str:
+            return 'x'
+
+        with overlay():
+            _reset_config()
+            assert 'localhost' == host()
+        assert 'at-runtime' == host()
+
+    assert 'outer' == host()
+    replace('test.declared_in_overlay', function=lambda: 'y')
+    assert 'y' == declared_in_overlay()
+
+
+def test_namespace_lookup():
+    from .. import config_names, get_namespace
+
+    @replaceable('test_namespace.db.host')
+    def host() -> str:
+        return 'localhost'
+
+    @replaceable('test_namespace.dbx')
+    def dbx() -> str:
+        return 'x'
+
+    replace('test_namespace.db.port', function=lambda: 5432)
+    assert ['test_namespace.db.host', 'test_namespace.db.port'] == config_names('test_namespace.db.')
+    assert ['test_namespace.db.host', 'test_namespace.db.port', 'test_namespace.dbx'] \
+           == config_names('test_namespace.db')
+    assert {'test_namespace.db.host': 'localhost', 'test_namespace.db.port': 5432} \
+           == {name: function() for name, function in get_namespace('test_namespace.db.').items()}
+
+    from .. import _replace_layer
+    replace('test_namespace.db.user', function=lambda: 'mara', layer='runtime')
+    assert 'test_namespace.db.user' in config_names('test_namespace.')
+    _replace_layer('runtime', {})
+    assert ['test_namespace.db.host', 'test_namespace.db.port'] == config_names('test_namespace.db.')
+    assert [] == config_names('test_namespace.unknown')
+
+
+def test_cached_value_is_not_stored_when_a_dependency_is_replaced_while_computing():
+    @replaceable('test.host')
+    def host() -> str:
+        return 'old'
+
+    replaced = []
+
+    @replaceable('test.url', cache=True)
+    def url() -> str:
+        value = host()
+        if not replaced:
+            # e.g. a reload in another thread
+            replace('test.host', function=lambda: 'new')
+            replaced.append(True)
+        return f'db://{value}'
+
+    assert 'db://old' == url()
+    assert 'db://new' == url()
@@ -0,0 +1,104 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from .. import replace, replaceable, override
+from .. import evaluation
+from ...testing import overlay
+
+
+@pytest.fixture(autouse=True)
+def setup_config(monkeypatch):
+    monkeypatch.setattr(evaluation, '_last_evaluation', None)
+    # a new pool, the threads of the previous one wait for calls forever
+    monkeypatch.setattr(evaluation, '_calls', queue.SimpleQueue())
+    monkeypatch.setattr(evaluation, '_workers', [])
+    monkeypatch.setattr(evaluation, '_running', {})
+    with overlay():
+        yield
+
+
+def test_evaluate_config():
+    @replaceable('test.value')
+    def value() -> int:
+        """A value"""
+        return 1
+
+    @replaceable('test.failing')
+    def failing() -> int:
+        raise ValueError('broken')
+
+    replace('test.only_replaced', function=lambda: 'x')
+
+    with override({'test.value': lambda: 2}):
+        results = {result.name: result for result in evaluation.evaluate_config(max_age=0)}
+
+    assert {'test.failing', 'test.only_replaced', 'test.value'} <= set(results)
+    assert 2 == results['test.value'].value
+    assert 'A value' == results['test.value'].doc
+    assert results['test.value'].duration >= 0
+    assert 'ValueError: broken' == results['test.failing'].error
+
+
+def test_evaluate_config_times_out_slow_functions():
+    replace('mara_base.config_evaluation_timeout', function=lambda: 0.1)
+    replace('test.slow', function=lambda: time.sleep(1))
+    replace('test.fast', function=lambda: 'x')
+
+    start = time.monotonic()
+    results = {result.name: result for result in evaluation.evaluate_config(max_age=0)}
+
+    assert time.monotonic() - start < 0.5
+    assert 'x' == results['test.fast'].value
+    assert results['test.slow'].duration is None
+    assert 'Timed out' in results['test.slow'].error
+
+
+def test_evaluate_config_reuses_recent_results():
+    calls = []
+    replace('test.counted', function=lambda: calls.append(1))
+
+    evaluation.evaluate_config(max_age=60)
+    evaluation.evaluate_config(max_age=60)
+    assert 1 == len(calls)
+
+
+def test_evaluate_config_is_not_blocked_by_stuck_functions():
+    replace('mara_base.config_evaluation_timeout', function=lambda: 0.1)
+    replace('mara_base.config_evaluation_workers', function=lambda: 2)
+    stuck = threading.Event()
+    replace('test.stuck', function=stuck.wait)
+    replace('test.value', function=lambda: 'x')
+
+    try:
+        results = {result.name: result for result in evaluation.evaluate_config(max_age=0)}
+        assert 'Timed out' in results['test.stuck'].error
+        threads = threading.active_count()
+        for _ in range(3):
+            start = time.monotonic()
+            results = {result.name: result for result in evaluation.evaluate_config(max_age=0)}
+            assert time.monotonic() - start < 0.5
+            assert results['test.stuck'].error.startswith('Still running')
+            assert 'x' == results['test.value'].value
+        assert threads == threading.active_count()
+
+        # all threads are taken by calls which don't return
+        replace('test.stuck_too', function=stuck.wait)
+        replace('test.zzz', function=lambda: 'z')
+        results = {result.name: result for result in evaluation.evaluate_config(max_age=0)}
+        assert 'Timed out' in results['test.stuck_too'].error
+        assert results['test.zzz'].error.startswith('Not evaluated')
+    finally:
+        stuck.set()
+
+
+def test_evaluate_config_only_looks_up_the_given_names(monkeypatch):
+    calls = []
+    replace('test.a', function=lambda: calls.append('a'))
+    replace('test.b', function=lambda: calls.append('b'))
+    monkeypatch.setattr(evaluation, '_current_functions', None)
+
+    assert ['test.a'] == [result.name for result in evaluation.evaluate_config(max_age=60, names=['test.a', 'x'])]
+    assert ['a'] == calls
@@ -0,0 +1,91 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from .. import replace, replaceable
+from ..prefetch import prefetch_config
+from ...testing import overlay
+
+
+@pytest.fixture(autouse=True)
+def setup_config():
+    with overlay():
+        yield
+
+
+@pytest.fixture()
+def secrets_agent():
+    """A stub of a slow secrets agent which answers each line with the secret for it, returns its port"""
+    requests = []
+    loop = asyncio.new_event_loop()
+
+    async def answer(reader, writer):
+        name = (await reader.readline()).decode().strip()
+        requests.append(name)
+        await asyncio.sleep(0.2)
+        writer.write(f'secret-of-{name}\n'.encode())
+        await writer.drain()
+        writer.close()
+
+    server = loop.run_until_complete(asyncio.start_server(answer, '127.0.0.1', 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield server.sockets[0].getsockname()[1], requests
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    server.close()
+    loop.run_until_complete(server.wait_closed())
+    loop.close()
+
+
+async def _fetch_secret(port: int, name: str) -> str:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'{name}\n'.encode())
+    secret = (await reader.readline()).decode().strip()
+    writer.close()
+    return secret
+
+
+def test_prefetch_config(secrets_agent):
+    port, requests = secrets_agent
+
+    @replaceable('test.db_password')
+    async def db_password() -> str:
+        return await _fetch_secret(port, 'db')
+
+    @replaceable('test.api_key')
+    def api_key() -> str:
+        return ''
+
+    @replace('test.api_key')
+    async def api_key_from_agent() -> str:
+        return await _fetch_secret(port, 'api')
+
+    @replaceable('test.hanging')
+    def hanging() -> str:
+        return ''
+
+    # a replacement, so that later tests don't wait for it
+    @replace('test.hanging')
+    async def hanging_agent() -> str:
+        await asyncio.sleep(10)
+
+    start = time.monotonic()
+    errors = prefetch_config(timeout=1)
+    # both providers waited at the same time
+    assert time.monotonic() - start < 1.4
+    assert ['test.hanging'] == list(errors)
+
+    assert 'secret-of-db' == db_password()
+    assert 'secret-of-api' == api_key()
+    assert ['api', 'db'] == sorted(requests)
+
+    # a replacement is resolved on its next call
+    @replace('test.db_password')
+    async def other_db_password() -> str:
+        return await _fetch_secret(port, 'other-db')
+
+    assert 'secret-of-other-db' == db_password()
+    assert 3 == len(requests)
@@ -0,0 +1,83 @@
+import os
+import sys
+import time
+
+import pytest
+
+from .. import replaceable, config_generation, get_provenance
+from .. import reload
+from ...testing import overlay
+
+# the config system as imported by the tests, which is not necessarily `mara_base.config_system`
+config_system = sys.modules[replaceable.__module__]
+
+
+@pytest.fixture(autouse=True)
+def setup_config(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    with overlay():
+        yield
+        reload.stop_watching()
+    sys.modules.pop('reloaded_local_setup', None)
+
+
+def _load_local_setup(tmp_path, monkeypatch, code: str):
+    from .. import _loading_layer
+    (tmp_path / 'reloaded_local_setup.py').write_text(code)
+    monkeypatch.setattr(config_system, '_local_setup_module', 'reloaded_local_setup')
+    with _loading_layer('local_setup'):
+        __import__('reloaded_local_setup')
+
+
+def _write(path, text: str):
+    path.write_text(text)
+    # make sure the modification time changes also on file systems with a coarse resolution
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 10_000_000))
+
+
+def test_reload_config(tmp_path, monkeypatch):
+    @replaceable('test.host')
+    def host() -> str:
+        return 'localhost'
+
+    @replaceable('test.port')
+    def port() -> int:
+        return 5432
+
+    _load_local_setup(tmp_path, monkeypatch,
+                      f"from {config_system.__name__} import replace\nreplace('test.host', function=lambda: 'a')\n")
+    _write(tmp_path / '.env', 'MARA_TEST__PORT=1\n')
+    reload.reload_config()
+    assert ('a', 1) == (host(), port())
+    assert 'local_setup' == get_provenance('test.host').layer
+
+    generation = config_generation()
+    assert [] == reload.reload_config()
+    assert generation == config_generation()
+
+    _write(tmp_path / 'reloaded_local_setup.py',
+           f"from {config_system.__name__} import replace\nreplace('test.host', function=lambda: 'b')\n")
+    _write(tmp_path / '.env', '')
+    assert ['test.host', 'test.port'] == reload.reload_config()
+    assert ('b', 5432) == (host(), port())
+    assert generation != config_generation()
+
+    # a broken local_setup.py doesn't change anything
+    _write(tmp_path / 'reloaded_local_setup.py', "raise Exception('broken')\n")
+    assert [] == reload.reload_config()
+    assert 'b' == host()
+
+
+def test_watching(tmp_path, monkeypatch):
+    @replaceable('test.port')
+    def port() -> int:
+        return 5432
+
+    _write(tmp_path / '.env', '')
+    reload.start_watching(interval=0.01)
+    _write(tmp_path / '.env', 'MARA_TEST__PORT=1\n')
+    deadline = time.monotonic() + 5
+    while port() != 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert 1 == port()
@@ -0,0 +1,112 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from .. import replace, replaceable, _replace_layer, get_provenance
+from .. import shared
+from ...testing import overlay
+
+
+@pytest.fixture(autouse=True)
+def setup_config():
+    with overlay():
+        yield
+        shared.stop_sharing()
+
+
+def test_replace_is_visible_in_forked_processes(tmp_path):
+    @replaceable('test.kill_switch')
+    def kill_switch() -> bool:
+        return False
+
+    @replaceable('test.with_argument')
+    def with_argument(argument: str = None) -> str:
+        return 'x'
+
+    path = shared.share_config(str(tmp_path / 'shared-config'))
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            # the child waits for the parent's replacement and reports back with its own one
+            os.close(read_fd)
+            deadline = time.monotonic() + 5
+            while not kill_switch() and time.monotonic() < deadline:
+                time.sleep(0.001)
+            replace('test.kill_switch', function=lambda: False, layer='runtime')
+            os.write(write_fd, b'1' if get_provenance('test.kill_switch').layer == 'runtime' else b'0')
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    replace('test.kill_switch', function=lambda: True, layer='runtime')
+    assert b'1' == os.read(read_fd, 1)
+    os.waitpid(pid, 0)
+    os.close(read_fd)
+
+    # the runtime layer of this process still wins over the value of the child
+    assert kill_switch() is True
+    _replace_layer('runtime', {})
+    shared._region.update({'test.kill_switch': [True, 'elsewhere', 1]}, [])
+    assert kill_switch() is True
+    assert ('shared', 'elsewhere (process 1)') == get_provenance('test.kill_switch')
+    # functions with parameters are not shared
+    assert 'test.with_argument' not in shared._region.read()[1]
+    assert os.path.exists(path)
+
+
+
+def test_writer_dying_while_writing_is_repaired(tmp_path):
+    @replaceable('test.kill_switch')
+    def kill_switch() -> bool:
+        return False
+
+    shared.share_config(str(tmp_path / 'shared-config'))
+    region = shared._region
+    generation, data = region.read()
+    # a process was killed between marking the write and finishing it
+    shared._GENERATION.pack_into(region.mmap, 0, generation + 1)
+
+    start = time.monotonic()
+    assert (generation + 2, data) == region.read()
+    assert time.monotonic() - start < 1
+    replace('test.kill_switch', function=lambda: True, layer='runtime')
+    assert region.read()[1]['test.kill_switch'][0] is True
+
+
+def test_replace_in_process_forked_while_the_registry_is_locked():
+    config_system = sys.modules[replace.__module__]
+    locked, release = threading.Event(), threading.Event()
+
+    def hold_lock():
+        with config_system._registry_lock:
+            locked.set()
+            release.wait()
+
+    thread = threading.Thread(target=hold_lock)
+    thread.start()
+    locked.wait()
+    pid = os.fork()
+    if pid == 0:
+        # the thread holding the lock doesn't exist in the child
+        exit_code = 1
+        try:
+            replace('test.forked', function=lambda: 'x')
+            exit_code = 0
+        finally:
+            os._exit(exit_code)
+    release.set()
+    thread.join()
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        finished, status = os.waitpid(pid, os.WNOHANG)
+        if finished:
+            break
+        time.sleep(0.01)
+    else:
+        os.kill(pid, 9)
+        os.waitpid(pid, 0)
+        pytest.fail('The forked process is blocked by the lock of the parent')
+    assert 0 == os.waitstatus_to_exitcode(status)
@@ -0,0 +1,68 @@
+import pytest
+
+from .. import replace, replaceable
+from ..snapshot import freeze_config, load_config_snapshot
+from ...testing import overlay
+
+
+@pytest.fixture(autouse=True)
+def setup_config():
+    with overlay():
+        yield
+
+
+def test_freeze_and_load_config_snapshot(tmp_path):
+    @replaceable('test.db')
+    def db() -> dict:
+        return {}
+
+    path = str(tmp_path / 'snapshot.json')
+    with overlay():
+        replace('test.db', function=lambda: {'host': 'localhost'})
+        assert [] == freeze_config(path)
+
+    assert {} == db()
+    assert load_config_snapshot(path)
+    assert {'host': 'localhost'} == db()
+
+
+def test_incomplete_snapshot_is_not_loaded(tmp_path):
+    path = str(tmp_path / 'snapshot.json')
+    replace('test.with_argument', function=lambda argument: argument)
+    replace('test.not_json', function=lambda: object())
+    assert ['test.with_argument', 'test.not_json'] == freeze_config(path)
+
+    assert not load_config_snapshot(path)
+
+
+def test_outdated_snapshot_is_not_loaded(tmp_path, monkeypatch):
+    path = str(tmp_path / 'snapshot.json')
+    replace('test.value', function=lambda: 1)
+    freeze_config(path)
+
+    monkeypatch.setenv('MARA_TEST__VALUE', '2')
+    assert not load_config_snapshot(path)
+
+
+def test_cli_and_runtime_layers_are_not_frozen(tmp_path):
+    from .. import get_provenance
+
+    @replaceable('test.debug')
+    def debug() -> bool:
+        return False
+
+    @replaceable('test.host')
+    def host() -> str:
+        return 'localhost'
+
+    path = str(tmp_path / 'snapshot.json')
+    with overlay():
+        replace('test.debug', function=lambda: True, layer='cli')
+        replace('test.host', function=lambda: 'from-local-setup', layer='local_setup')
+        replace('test.host', function=lambda: 'at-runtime', layer='runtime')
+        assert [] == freeze_config(path)
+
+    assert load_config_snapshot(path)
+    assert debug() is False
+    assert 'from-local-setup' == host()
+    assert 'local_setup' == get_provenance('test.host').layer
@@ -0,0 +1,44 @@
+import flask
+import pytest
+
+from .. import replace, replaceable
+from .. import view
+from ...testing import overlay
+
+
+@pytest.fixture()
+def client():
+    with overlay():
+        app = flask.Flask(__name__)
+        app.register_blueprint(view.mara_config)
+        yield app.test_client()
+
+
+def test_configuration_api(client):
+    calls = []
+
+    for i in range(5):
+        @replaceable(f'test.value_{i}')
+        def value(i=i) -> int:
+            calls.append(i)
+            return i
+
+    response = client.get('/config2/api', query_string={'module': __name__, 'per_page': 2, 'page': 2})
+    assert 200 == response.status_code
+    assert 5 == response.json['total']
+    assert [('test.value_2', 2), ('test.value_3', 3)] \
+           == [(config['name'], config['value']) for config in response.json['configs']]
+    assert [2, 3] == calls
+
+    etag = response.headers['ETag']
+    response = client.get('/config2/api', query_string={'module': __name__, 'per_page': 2, 'page': 2},
+                          headers={'If-None-Match': etag})
+    assert 304 == response.status_code
+    assert [2, 3] == calls
+
+    replace('test.value_2', function=lambda: 42)
+    response = client.get('/config2/api', query_string={'module': __name__, 'per_page': 2, 'page': 2},
+                          headers={'If-None-Match': etag})
+    assert 200 == response.status_code
+    assert 42 == response.json['configs'][0]['value']
+    assert 'package' == response.json['configs'][0]['layer']
@@ -1,14 +1,19 @@
 """Mara admin views"""
 
+import hashlib
 import html
+import json
+import os
 import pprint
 import sys
+import uuid
 
 import flask
 from mara_page import acl
 from mara_page import navigation, response, _, bootstrap
 
-from . import get_get_current_config
+from . import get_call_statistics, config_generation, config_names, _current_function
+from .evaluation import evaluate_config, _describe
 
 mara_config = flask.Blueprint('mara_config', __name__, url_prefix='/config2', static_folder='static')
 
@@ -18,19 +23,23 @@ acl_resource = acl.AclResource('Configuration')
 @mara_config.route('/')
 @acl.require_permission(acl_resource)
 def configuration_page():
+    """All config values, or only those of the config functions whose names start with the `namespace` parameter"""
+    namespace = flask.request.args.get('namespace', '')
+    calls = {}
+    for statistic in get_call_statistics():
+        calls[statistic.config_name] = calls.get(statistic.config_name, 0) + statistic.calls
+
     config_modules = {}
-    for configs in get_get_current_config():
-        api_name, func = configs
-        module_name = func.__module__
-        module = sys.modules[module_name]
-        if module_name not in config_modules:
-            config_modules[module_name] = {'doc': module.__doc__, 'functions': {}}
-        try:
-            value = func()
-        except Exception:
-            value = 'error calling function'
-        config_modules[module_name]['functions'][api_name] \
-            = {'doc': func.__doc__ or '', 'value': value}
+    for config in evaluate_config(names=config_names(namespace) if namespace else None):
+        module = sys.modules.get(config.module)
+        if config.module not in config_modules:
+            config_modules[config.module] = {'doc': getattr(module, '__doc__', None) or '', 'functions': {}}
+        config_modules[config.module]['functions'][config.name] \
+            = {'doc': config.doc,
+               'value': config.value if config.error is None else config.error,
+               'duration': '' if config.duration is None else f'{config.duration * 1000:.1f} ms',
+               'calls': f'{calls[config.name]} calls' if config.name in calls else '',
+               'provenance': f'{config.layer}: {config.source}'}
 
     return response.Response(
         html=[(bootstrap.card(
@@ -40,14 +49,59 @@ def configuration_page():
                       [],
                       [_.tr[
                            _.td[function_name.replace('_', '_<wbr/>')],
-                           _.td[_.em[function['doc']]],
-                           _.td[_.pre[html.escape(pprint.pformat(function['value']))]]]
+                           _.td[_.em[html.escape(function['doc'])]],
+                           _.td[_.pre[html.escape(pprint.pformat(function['value']))]],
+                           _.td[_.small[html.escape(function['provenance'])]],
+                           _.td[function['duration']],
+                           _.td[function['calls']]]
                        for function_name, function in config['functions'].items()])
                   ]) if config['functions'] else '') for module_name, config in
               sorted(config_modules.items())],
         title='Mara Configuration')
 
 
+_process_token = uuid.uuid4().hex[:8]
+"""Makes the ETags of different processes (with their own config generations) differ"""
+
+
+@mara_config.route('/api')
+@acl.require_permission(acl_resource)
+def configuration_api():
+    """The config values as json
+
+    Query parameters: `namespace` (only config functions whose names start with it), `module` (only config
+    functions of modules starting with it), `page` (starting at 1) and `per_page` (Default: 100, at most 1000).
+    The ETag changes whenever config functions are replaced, a request with a matching `If-None-Match` header
+    is answered with 304 without evaluating anything.
+    """
+    namespace = flask.request.args.get('namespace', '')
+    module_prefix = flask.request.args.get('module', '')
+    page = max(flask.request.args.get('page', 1, type=int), 1)
+    per_page = min(max(flask.request.args.get('per_page', 100, type=int), 1), 1000)
+
+    query = f'{namespace}:{module_prefix}:{page}:{per_page}'.encode()
+    etag = f'{_process_token}-{os.getpid()}-{config_generation()}-{hashlib.sha1(query).hexdigest()[:8]}'
+    if etag in flask.request.if_none_match:
+        response = flask.Response(status=304)
+    else:
+        names = config_names(namespace)
+        if module_prefix:
+            names = [name for name in names
+                     if _describe(name, _current_function(name))[0].startswith(module_prefix)]
+        configs = evaluate_config(names=names[(page - 1) * per_page:page * per_page])
+        response = flask.Response(
+            json.dumps({'total': len(names), 'page': page, 'per_page': per_page,
+                        'configs': [{'name': config.name, 'value': config.value, 'error': config.error,
+                                     'doc': config.doc, 'module': config.module,
+                                     'layer': config.layer, 'source': config.source}
+                                    for config in configs]}, default=repr),
+            mimetype='application/json')
+    response.set_etag(etag)
+    # clients have to revalidate, which is cheap
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
 def navigation_entry_fns():
     return [navigation.NavigationEntry('Configuration',
                                        uri_fn=lambda: flask.url_for('.configuration_page'),
@@ -0,0 +1,21 @@
+import sys
+
+import pytest
+
+
+def _packages() -> list:
+    """mara_base, which is imported absolutely by some tests and relative to the repository by others"""
+    return [module for name, module in list(sys.modules.items())
+            if module is not None and (name == 'mara_base' or name.endswith('.mara_base'))]
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Cache files go to `tmp_path` instead of ~/.cache/mara, cached lookups are forgotten"""
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'mara-cache'))
+    for package in _packages():
+        monkeypatch.setattr(package, '_entry_points', None)
+        monkeypatch.setattr(package, '_loaded_entry_point_groups', set())
+        module_discovery = sys.modules.get(package.__name__ + '.module_discovery')
+        if module_discovery is not None:
+            monkeypatch.setattr(module_discovery, '_cache', None)
@@ -0,0 +1,126 @@
+"""
+Non-blocking logging for CLI commands
+
+The handlers of the root logger (stdout and syslog) are moved behind a bounded queue: logging calls only enqueue
+the record, a background thread writes the records in batches. When the queue is full, records are either dropped
+(and counted) or the logging call waits until there is space again. The queue is flushed at exit.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+
+log = logging.getLogger(__name__)
+
+_STOP = object()
+"""Put into the queue to stop the listener"""
+
+
+class _BoundedQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records, drops them when the queue is full unless `block` is set"""
+
+    def __init__(self, queue_: queue.Queue, block: bool):
+        super().__init__(queue_)
+        self.block = block
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.block:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _BatchingListener(threading.Thread):
+    """Writes the queued records to the handlers, up to `batch_size` records at once"""
+
+    def __init__(self, queue_: queue.Queue, handlers: [logging.Handler], batch_size: int = 500):
+        super().__init__(name='mara-log-queue', daemon=True)
+        self.queue = queue_
+        self.handlers = handlers
+        self.batch_size = batch_size
+
+    def run(self):
+        stopped = False
+        while not stopped:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in batch:
+                stopped = True
+                batch = [record for record in batch if record is not _STOP]
+            for record in batch:
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+            for handler in self.handlers:
+                handler.flush()
+
+
+_handler: _BoundedQueueHandler = None
+_listener: _BatchingListener = None
+
+
+def start(capacity: int = 10000, overflow: str = 'drop'):
+    """Moves all handlers of the root logger behind a queue with `capacity` records
+
+    Args:
+        capacity: How many records can be queued
+        overflow: What happens when the queue is full: 'drop' the record or 'block' until there is space
+    """
+    global _handler, _listener
+    if _listener is not None:
+        return
+    assert overflow in ('drop', 'block'), f"Unknown log queue overflow policy '{overflow}'"
+    queue_ = queue.Queue(maxsize=capacity)
+    handlers = list(logging.root.handlers)
+    _listener = _BatchingListener(queue_, handlers)
+    _handler = _BoundedQueueHandler(queue_, block=overflow == 'block')
+    for handler in handlers:
+        logging.root.removeHandler(handler)
+    logging.root.addHandler(_handler)
+    _listener.start()
+    atexit.register(stop)
+
+
+def stop():
+    """Writes all queued records and moves the handlers back to the root logger"""
+    global _handler, _listener
+    if _listener is None:
+        return
+    logging.root.removeHandler(_handler)
+    for handler in _listener.handlers:
+        logging.root.addHandler(handler)
+    _handler.queue.put(_STOP)
+    _listener.join()
+    if _handler.dropped:
+        log.warning("Dropped %s log records because the log queue was full", _handler.dropped)
+    _handler = _listener = None
+
+
+def _after_fork_in_child():
+    """The listener thread doesn't exist in forked processes, they log synchronously again"""
+    global _handler, _listener
+    if _listener is None:
+        return
+    logging.root.removeHandler(_handler)
+    for handler in _listener.handlers:
+        logging.root.addHandler(handler)
+    _handler = _listener = None
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def dropped_records() -> int:
+    """How many records were dropped because the queue was full"""
+    return _handler.dropped if _handler else 0
@@ -0,0 +1,134 @@
+"""
+Side effect free, cached lookup of modules and entry points
+
+Looking up `a.b.local_setup` with `importlib.import_module` or `importlib.util.find_spec` imports the parent
+packages `a` and `a.b`. The lookups here only ask the path based finders, so nothing is imported. Results
+(also negative ones) are cached in the process and in a cache file. They stay valid as long as the modification
+times of the searched directories don't change (which happens when modules are added or removed).
+"""
+
+import hashlib
+import importlib.machinery
+import importlib.util
+import json
+import os
+import sys
+
+from . import cache_files
+
+_cache: {str: dict} = None
+"""The cached lookups by key, loaded from the cache file on first use"""
+
+
+def cache_path() -> str:
+    """The file in which lookups are cached across processes"""
+    return os.path.join(cache_files.cache_directory(), 'module-discovery.json')
+
+
+def _search_path() -> [str]:
+    """`sys.path` with the current directory (`''`) and relative entries resolved"""
+    return [os.path.abspath(path or os.curdir) for path in sys.path]
+
+
+def _path_key() -> str:
+    # the same module name resolves differently with another sys.path or in another directory
+    return hashlib.sha1(json.dumps(_search_path()).encode()).hexdigest()[:12]
+
+
+def _find_spec(module_name: str) -> (importlib.machinery.ModuleSpec, [str]):
+    """Finds the spec of a module without importing its parent packages
+
+    Returns the spec (None if the module doesn't exist) and the directories which were searched.
+    """
+    if module_name in sys.modules:
+        return sys.modules[module_name].__spec__, []
+    parent_name, _, _ = module_name.rpartition('.')
+    if not parent_name:
+        # a top level module, looking it up has no side effects
+        return importlib.util.find_spec(module_name), [path for path in _search_path() if os.path.isdir(path)]
+    parent_spec, search_paths = _find_spec(parent_name)
+    if parent_spec is None or parent_spec.submodule_search_locations is None:
+        return None, search_paths
+    locations = [os.path.abspath(location) for location in parent_spec.submodule_search_locations]
+    return importlib.machinery.PathFinder.find_spec(module_name, locations), search_paths + locations
+
+
+def _lookup(key: str, candidates: [str]) -> str:
+    """Returns the first of `candidates` which exists, cached under `key`"""
+    global _cache
+    if _cache is None:
+        _cache = cache_files.read_json(cache_path()) or {}
+    key += ':' + _path_key()
+    entry = _cache.get(key)
+    if entry is not None and cache_files.file_mtimes(entry['search_paths'].keys()) == entry['search_paths']:
+        return entry['module']
+    found = None
+    searched = []
+    for candidate in candidates:
+        spec, search_paths = _find_spec(candidate)
+        searched += search_paths
+        if spec is not None:
+            found = candidate
+            break
+    if searched:
+        # lookups of already imported modules are not cached, nothing tells when they become invalid
+        _cache[key] = {'module': found, 'search_paths': cache_files.file_mtimes(searched)}
+        try:
+            cache_files.write_json(cache_path(), _cache)
+        except OSError:
+            pass
+    return found
+
+
+def module_exists(module_name: str) -> bool:
+    """Whether `module_name` can be imported, without importing it or its parent packages"""
+    return _lookup(module_name, [module_name]) is not None
+
+
+def find_local_setup(app_module: str) -> str:
+    """The local_setup module of `app_module` or of the first of its parent packages which has one"""
+    parts = app_module.split('.')
+    return _lookup(f'{app_module}:local_setup',
+                   ['.'.join(parts[:length]) + '.local_setup' for length in range(len(parts), 0, -1)])
+
+
+def find_entry_points(group_prefix: str) -> {str: [(str, str)]}:
+    """The `(name, value)` of all entry points in groups starting with `group_prefix`, by group
+
+    Reading the metadata of all installed distributions takes a while, so the result is cached as long as
+    no package is installed or removed and the metadata files with matching entry points don't change.
+    """
+    global _cache
+    if _cache is None:
+        _cache = cache_files.read_json(cache_path()) or {}
+    key = f'entry_points:{group_prefix}:' + _path_key()
+    entry = _cache.get(key)
+    if (entry is not None and cache_files.installed_packages_mtimes() == entry['installed_packages']
+            and cache_files.file_mtimes(entry['files'].keys()) == entry['files']):
+        return {group: [tuple(entry_point) for entry_point in entry_points]
+                for group, entry_points in entry['entry_points'].items()}
+    import importlib.metadata
+    entry_points = {}
+    files = []
+    seen_distributions = set()
+    for distribution in importlib.metadata.distributions():
+        # a distribution can be found more than once in sys.path, the first one wins
+        distribution_name = (distribution.metadata['Name'] or '').lower().replace('-', '_')
+        if distribution_name in seen_distributions:
+            continue
+        seen_distributions.add(distribution_name)
+        for entry_point in distribution.entry_points:
+            if entry_point.group.startswith(group_prefix):
+                entry_points.setdefault(entry_point.group, []).append((entry_point.name, entry_point.value))
+                metadata_path = getattr(distribution, '_path', None)
+                if metadata_path:
+                    # e.g. the egg-info of packages installed in development mode
+                    files.append(os.path.join(str(metadata_path), 'entry_points.txt'))
+    _cache[key] = {'entry_points': entry_points,
+                   'installed_packages': cache_files.installed_packages_mtimes(),
+                   'files': cache_files.file_mtimes(files)}
+    try:
+        cache_files.write_json(cache_path(), _cache)
+    except OSError:
+        pass
+    return entry_points
@@ -9,6 +9,7 @@ There are other excellent libraries for this, which unfortunately don't excactly
 - https://bitbucket.org/schesis/ook
 """
 
+import contextlib
 import functools
 import sys
 import typing
@@ -20,6 +21,107 @@ The dictionary maps the module and name of the original function to a tuple  to
 """
 
 
+class _PatchStack:
+    """All patches and wraps of a function, in the order they were applied
+
+    When the last entry is a patch, the patch itself is installed in place of the function. Otherwise a single
+    dispatcher is installed, which calls a chain composed from the stack with `functools.partial`, so each
+    wrap only adds the frame of the wrapping function itself.
+    """
+
+    def __init__(self, module, name: str, original_function: typing.Callable):
+        self.module = module
+        self.name = name
+        self.original_function = original_function
+        self.entries: [(str, typing.Callable, str)] = []
+        """kind ('patch' or 'wrap'), new function and its name"""
+        self.chain = original_function
+
+        def dispatcher(*args, **kwargs):
+            return self.chain(*args, **kwargs)
+
+        # copy properies such as __doc__, __module__ from original_function to dispatcher
+        functools.update_wrapper(dispatcher, original_function)
+        self.dispatcher = dispatcher
+        self.installed = original_function
+        """The function which is installed in the module"""
+
+    def compose(self):
+        chain = self.original_function
+        for kind, new_function, _ in self.entries:
+            # a patch replaces everything applied before, a wrap gets it as first argument
+            chain = new_function if kind == 'patch' else functools.partial(new_function, chain)
+        self.chain = chain
+        # a patch replaces everything below it, so it can be called without the dispatcher
+        self.installed = chain if self.entries and self.entries[-1][0] == 'patch' else self.dispatcher
+
+
+PATCH_STACKS: {str: _PatchStack} = {}
+"""The patch stacks by module and name of the patched function"""
+
+
+_overlays: [dict] = []
+"""The undo journals of the active `overlay()` blocks, innermost last"""
+
+
+def _journal(key: str, module, name: str):
+    """Records the state of a patched function before its first change in the innermost overlay"""
+    if _overlays and key not in _overlays[-1]:
+        stack = PATCH_STACKS.get(key)
+        _overlays[-1][key] = (module, name, getattr(module, name, None), stack,
+                              list(stack.entries) if stack else None, REPLACED_FUNCTIONS.get(key))
+
+
+@contextlib.contextmanager
+def overlay():
+    """Undoes all patches, wraps and unpatches within the block, e.g. in a test"""
+    journal = {}
+    _overlays.append(journal)
+    try:
+        yield
+    finally:
+        assert _overlays[-1] is journal, 'Overlays are left in a different order than they were entered'
+        _overlays.pop()
+        for key, (module, name, function, stack, entries, replaced_function) in journal.items():
+            if function is not None:
+                setattr(module, name, function)
+            elif hasattr(module, name):
+                delattr(module, name)
+            if stack is None:
+                PATCH_STACKS.pop(key, None)
+                REPLACED_FUNCTIONS.pop(key, None)
+            else:
+                stack.entries = entries
+                stack.compose()
+                PATCH_STACKS[key] = stack
+                REPLACED_FUNCTIONS[key] = replaced_function
+
+
+def _qualified_name(function: typing.Callable) -> str:
+    return f'{sys.modules[function.__module__].__name__}.{function.__name__}'
+
+
+def _push(original_function: typing.Callable, kind: str, new_function: typing.Callable,
+          new_function_name: str) -> _PatchStack:
+    """Adds a patch or a wrap to the stack of `original_function` and installs the composed stack"""
+    key = _qualified_name(original_function)
+    module = sys.modules[original_function.__module__]
+    _journal(key, module, original_function.__name__)
+    stack = PATCH_STACKS.get(key)
+    if stack is None or getattr(module, original_function.__name__, None) is not stack.installed:
+        # first patch or the function was replaced by other means in the meantime
+        stack = PATCH_STACKS[key] = _PatchStack(module, original_function.__name__,
+                                                getattr(module, original_function.__name__, original_function))
+    stack.entries.append((kind, new_function, new_function_name))
+    stack.compose()
+
+    # record function replacement for inspection purposes
+    REPLACED_FUNCTIONS[key] = new_function_name
+
+    setattr(module, stack.name, stack.installed)
+    return stack
+
+
 def patch(original_function: typing.Callable) -> typing.Callable:
     """
     A decorator for replacing a function in another module
@@ -52,15 +154,14 @@ def patch(original_function: typing.Callable) -> typing.Callable:
         if not isinstance(original_function, typing.Callable):
             raise TypeError("Argument passed to @patch decorator must be a Callable")
 
-        # record function replacement for inspection purposes
-        REPLACED_FUNCTIONS[f'{sys.modules[original_function.__module__].__name__}.{original_function.__name__}'] \
-            = f'{sys.modules[new_function.__module__].__name__}.{new_function.__name__}'
+        # record the name before update_wrapper renames it
+        new_function_name = _qualified_name(new_function)
 
         # copy properies such as __doc__, __module__ from original_function to new_function
         functools.update_wrapper(new_function, original_function)
 
         # replace function
-        setattr(sys.modules[original_function.__module__], original_function.__name__, new_function)
+        _push(original_function, 'patch', new_function, new_function_name)
         return new_function
 
     return decorator
@@ -85,6 +186,8 @@ def wrap(original_function: typing.Callable) -> typing.Callable:
     >>> some_package.some_module.some_function(1)
     3
 
+    Wrapping an already patched or wrapped function adds the wrap on top of the previous ones.
+
     Args:
         original_function: The function or method to wrap
 
@@ -95,19 +198,46 @@ def wrap(original_function: typing.Callable) -> typing.Callable:
         if not isinstance(original_function, typing.Callable):
             raise TypeError("Argument passed to @wrap decorator must be a Callable")
 
-        # record function replacement for inspection purposes
-        REPLACED_FUNCTIONS[f'{sys.modules[original_function.__module__].__name__}.{original_function.__name__}'] \
-            = f'{sys.modules[new_function.__module__].__name__}.{new_function.__name__}'
+        # supply the function below in the stack as first argument to new_function
+        return _push(original_function, 'wrap', new_function, _qualified_name(new_function)).dispatcher
 
-        # supply orginal_function as first argument to new_function
-        def wrapper(*args, **kwargs):
-            return new_function(original_function, *args, **kwargs)
+    return decorator
 
-        # copy properies such as __doc__, __module__ from original_function to wrapper
-        functools.update_wrapper(wrapper, original_function)
 
-        # replace function
-        setattr(sys.modules[original_function.__module__], original_function.__name__, wrapper)
-        return wrapper
+def unpatch(patched_function: typing.Callable, new_function: typing.Callable = None):
+    """
+    Removes a patch or a wrap, or all of them
 
-    return decorator
+    Example:
+    >>> def new_function(original_function, x):
+    ...      return original_function(x) + 1
+
+    >>> wrap(some_package.some_module.some_function)(new_function)
+    >>> unwrap(some_package.some_module.some_function, new_function)
+
+    Args:
+        patched_function: The patched or wrapped function
+        new_function: The function passed to the @patch or @wrap decorator. Without it, all patches and wraps
+                      are removed and the original function is restored.
+    """
+    key = _qualified_name(patched_function)
+    stack = PATCH_STACKS.get(key)
+    if stack is None:
+        raise ValueError(f'{key} is not patched')
+    _journal(key, stack.module, stack.name)
+    if new_function is not None:
+        entries = [entry for entry in stack.entries if entry[1] is not new_function]
+        if len(entries) == len(stack.entries):
+            raise ValueError(f'{new_function} is not a patch of {key}')
+        stack.entries = entries
+    if new_function is None or not stack.entries:
+        setattr(stack.module, stack.name, stack.original_function)
+        del PATCH_STACKS[key]
+        del REPLACED_FUNCTIONS[key]
+        return
+    stack.compose()
+    setattr(stack.module, stack.name, stack.installed)
+    REPLACED_FUNCTIONS[key] = stack.entries[-1][2]
+
+
+unwrap = unpatch
@@ -0,0 +1,201 @@
+"""
+A warm `mara` server and the thin client of the `mara` entry point
+
+`mara serve` keeps a process with the composed app running. The `mara` entry point forwards its arguments,
+environment, working directory and stdio (as file descriptors) over a Unix socket to that process, which runs
+the command in a forked child and sends back the exit code. When local_setup.py, the app modules or the installed
+packages change, the server restarts itself and the client runs the command in-process. Without a running server,
+the client runs the command in-process as well.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import signal
+import socket
+import struct
+import sys
+
+from . import cache_files
+
+log = logging.getLogger(__name__)
+
+
+def socket_path() -> str:
+    """The socket of the server for the current directory and app"""
+    key = hashlib.sha1(f'{os.getcwd()}:{os.environ.get("MARA_APP", "app.app")}'.encode()).hexdigest()[:12]
+    return os.path.join(cache_files.cache_directory(), f'server-{key}.sock')
+
+
+def _send_message(connection: socket.socket, message: dict):
+    data = json.dumps(message).encode()
+    connection.sendall(struct.pack('!I', len(data)) + data)
+
+
+def _receive_message(connection: socket.socket) -> dict:
+    """The next message, None if the connection was closed"""
+    data = b''
+    for size in (4, None):
+        if size is None:
+            size, = struct.unpack('!I', data)
+            data = b''
+        while len(data) < size:
+            chunk = connection.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+    return json.loads(data)
+
+
+def run_in_server(argv: [str]) -> int:
+    """Runs a command in the server, returns its exit code or None if no (up to date) server is running"""
+    path = socket_path()
+    if not os.path.exists(path):
+        return None
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+        socket.send_fds(connection, [b'\0'], [sys.stdin.fileno(), sys.stdout.fileno(), sys.stderr.fileno()])
+        _send_message(connection, {'argv': argv, 'cwd': os.getcwd(), 'env': dict(os.environ)})
+        response = _receive_message(connection)
+        if not response or 'pid' not in response:
+            # the server restarts because the code changed
+            return None
+
+        # Ctrl-C and friends go to the process which runs the command
+        def forward(signum, _):
+            os.kill(response['pid'], signum)
+
+        for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+            signal.signal(signum, forward)
+        result = _receive_message(connection)
+        return result['exit_code'] if result else 1
+    except OSError:
+        return None
+    finally:
+        connection.close()
+
+
+def _fingerprint() -> dict:
+    """The state which makes the server restart when it changes: app code, local_setup.py and packages"""
+    installed_packages = cache_files.installed_packages_mtimes()
+    stdlib = os.path.dirname(os.__file__)
+    files = [module.__file__ for module in list(sys.modules.values())
+             if getattr(module, '__file__', None) and not module.__file__.startswith(stdlib)
+             and not any(module.__file__.startswith(path) for path in installed_packages)]
+    return {'files': cache_files.file_mtimes(files), 'installed_packages': installed_packages}
+
+
+def _run_command(connection: socket.socket, listener: socket.socket):
+    """Runs a command of a client in the current (forked) process, never returns"""
+    exit_code = 1
+    try:
+        listener.close()
+        for signum in (signal.SIGCHLD, signal.SIGTERM, signal.SIGHUP, signal.SIGINT):
+            signal.signal(signum, signal.SIG_DFL)
+        _, fds, _, _ = socket.recv_fds(connection, 1, 3)
+        request = _receive_message(connection)
+        _send_message(connection, {'pid': os.getpid()})
+
+        for stream in (sys.stdout, sys.stderr):
+            stream.flush()
+        for target_fd, fd in enumerate(fds):
+            os.dup2(fd, target_fd)
+            os.close(fd)
+        os.chdir(request['cwd'])
+        from .config_system import add_config_from_environment, default_environment_prefix
+        prefix = default_environment_prefix() + '_'
+        server_environment = cache_files.environment_hash(prefix)
+        os.environ.clear()
+        os.environ.update(request['env'])
+        sys.argv = ['mara'] + request['argv']
+        if '--debug' in request['argv']:
+            from .cli import _debug_from_commandline
+            from .config_system import replace
+            logging.root.setLevel(logging.DEBUG)
+            replace('debug', function=_debug_from_commandline, layer='cli')
+
+        if cache_files.environment_hash(prefix) != server_environment:
+            # the client's environment wins over the one of the server
+            add_config_from_environment()
+
+        from .cli import cli
+        try:
+            cli.main(args=request['argv'], prog_name='mara')
+            exit_code = 0
+        except SystemExit as e:
+            exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except BaseException:
+        log.exception("Running a command for a client failed")
+    finally:
+        try:
+            for stream in (sys.stdout, sys.stderr):
+                stream.flush()
+            _send_message(connection, {'exit_code': exit_code})
+        finally:
+            os._exit(exit_code)
+
+
+def _reap_children(*_):
+    try:
+        while os.waitpid(-1, os.WNOHANG)[0]:
+            pass
+    except ChildProcessError:
+        pass
+
+
+def _exit_on_signal(signum, _):
+    """Stops the server like an exception, so that the socket is removed"""
+    raise SystemExit(128 + signum)
+
+
+def serve():
+    """Runs commands of clients until the code changes, then restarts the server process"""
+    path = socket_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        os.unlink(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    os.chmod(path, 0o600)
+    listener.listen(64)
+    signal.signal(signal.SIGCHLD, _reap_children)
+    for signum in (signal.SIGTERM, signal.SIGHUP):
+        signal.signal(signum, _exit_on_signal)
+    fingerprint = _fingerprint()
+    log.info("Serving mara commands on %s", path)
+    try:
+        while True:
+            connection, _ = listener.accept()
+            if _fingerprint() != fingerprint:
+                log.info("Code changed, restarting")
+                connection.close()
+                break
+            if os.fork() == 0:
+                _run_command(connection, listener)
+            connection.close()
+    finally:
+        listener.close()
+        os.unlink(path)
+    os.execv(sys.executable, [sys.executable] + sys.argv)
+
+
+def _subcommand(argv: [str]) -> str:
+    """The name of the command in the arguments of `mara`, None if there is none
+
+    The options of `mara` itself are all flags, so it's the first argument which is not an option.
+    """
+    return next((arg for arg in argv if not arg.startswith('-')), None)
+
+
+def main():
+    """The `mara` entry point: runs the command in a running server or in-process"""
+    argv = sys.argv[1:]
+    # the config statistics of the startup are only collected in-process
+    if _subcommand(argv) not in ('serve', 'config-stats') and not os.environ.get('MARA_NO_SERVER'):
+        exit_code = run_in_server(argv)
+        if exit_code is not None:
+            sys.exit(exit_code)
+    from .cli import main as cli_main
+    cli_main()
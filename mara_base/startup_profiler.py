@@ -0,0 +1,78 @@
+"""
+Timing of the phases of the `mara` startup
+
+The timings are written in the Chrome trace event format (open them in chrome://tracing or https://ui.perfetto.dev)
+and summarized on stderr. Profiling is enabled with `mara --profile-startup` and costs nothing otherwise.
+"""
+
+import collections
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+import typing
+
+enabled = False
+
+_events: [dict] = []
+_totals: {str: [float, int]} = collections.defaultdict(lambda: [0, 0])
+
+
+def enable():
+    """Starts recording phases"""
+    global enabled
+    enabled = True
+
+
+def _record(name: str, category: str, start: int, end: int, args: dict):
+    _events.append({'name': name, 'cat': category, 'ph': 'X',
+                    'ts': start / 1000, 'dur': (end - start) / 1000,
+                    'pid': os.getpid(), 'tid': threading.get_ident(), 'args': args})
+    total = _totals[name]
+    total[0] += end - start
+    total[1] += 1
+
+
+@contextlib.contextmanager
+def phase(name: str, category: str = 'startup', **args):
+    """Records the time spent in the with block as a phase"""
+    if not enabled:
+        yield
+        return
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        _record(name, category, start, time.perf_counter_ns(), args)
+
+
+def profiled_items(name: str, iterable: typing.Iterable, category: str = 'contributions', **args) -> typing.Iterator:
+    """Yields the items of `iterable`, records the time spent producing them (but not consuming them)"""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter_ns()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            _record(name, category, start, time.perf_counter_ns(), args)
+            return
+        _record(name, category, start, time.perf_counter_ns(), args)
+        yield item
+
+
+def write_trace(path: str):
+    """Writes all recorded phases as Chrome trace events"""
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': _events, 'displayTimeUnit': 'ms'}, f)
+
+
+def print_summary(file=None):
+    """Prints the total time per phase, slowest first"""
+    file = file or sys.stderr
+    if not _totals:
+        return
+    max_len = max(len(name) for name in _totals)
+    for name, (duration, count) in sorted(_totals.items(), key=lambda item: item[1][0], reverse=True):
+        print(f'{name:<{max_len}} {duration / 1e6:10.1f} ms  ({count}x)', file=file)
@@ -0,0 +1,33 @@
+"""
+Test helpers for mara apps
+
+`overlay()` undoes all config replacements, registrations of functionality and monkey patches done within
+the block, without touching anything else. So the app can be composed once per test session (or per
+pytest-xdist worker) instead of resetting and re-importing it for each test.
+
+The `mara_overlay` fixture wraps a test in an overlay, enable it in a `conftest.py` with
+
+    pytest_plugins = ['mara_base.testing']
+"""
+
+import contextlib
+
+import pytest
+
+from . import overlay as contributions_overlay
+from .config_system import overlay as config_overlay
+from .monkey_patch import overlay as monkey_patch_overlay
+
+
+@contextlib.contextmanager
+def overlay():
+    """Undoes all config replacements, registrations and monkey patches within the block"""
+    with config_overlay(), contributions_overlay(), monkey_patch_overlay():
+        yield
+
+
+@pytest.fixture()
+def mara_overlay():
+    """Undoes all config replacements, registrations and monkey patches of a test"""
+    with overlay():
+        yield
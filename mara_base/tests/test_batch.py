@@ -0,0 +1,82 @@
+import subprocess
+import sys
+
+import pytest
+
+from mara_base import batch
+
+COMMANDS = """
+import os
+import sys
+
+import click
+
+
+@click.command()
+@click.argument('path')
+def touch(path):
+    "Writes the pid of the process running the command"
+    with open(path, 'w') as f:
+        f.write(str(os.getpid()))
+    print('touched', path)
+
+
+@click.command()
+def fail():
+    "Fails"
+    sys.exit(3)
+"""
+
+APP = """
+import mara_base
+
+
+def MARA_CLICK_COMMANDS():
+    from . import commands
+    yield commands.touch
+    yield commands.fail
+
+
+def compose_app():
+    import batch_app
+    mara_base.register_all_in_module(batch_app)
+"""
+
+
+def test_parse_invocations():
+    invocations = batch.parse_invocations(['# comment', '', 'a: x.touch "a b"', 'b <- a: x.touch c:d',
+                                           'x.touch --path=e', 'd <- a, b: x.fail'])
+    assert [('a', ['x.touch', 'a b'], []), ('b', ['x.touch', 'c:d'], ['a']),
+            ('3', ['x.touch', '--path=e'], []), ('d', ['x.fail'], ['a', 'b'])] == invocations
+
+    with pytest.raises(ValueError, match='Unknown dependencies'):
+        batch.parse_invocations(['a <- b: x'])
+    with pytest.raises(ValueError, match='Cyclic'):
+        batch.parse_invocations(['a <- b: x', 'b <- a: x'])
+
+
+def test_run_many(tmp_path, monkeypatch):
+    (tmp_path / 'batch_app').mkdir()
+    (tmp_path / 'batch_app' / '__init__.py').write_text(APP)
+    (tmp_path / 'batch_app' / 'commands.py').write_text(COMMANDS)
+    (tmp_path / 'commands.txt').write_text('second <- first: batch_app.touch second\n'
+                                           'failing: batch_app.fail\n'
+                                           'skipped <- failing: batch_app.touch skipped\n')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    monkeypatch.setenv('MARA_APP', 'batch_app')
+    monkeypatch.setenv('PYTHONPATH', str(tmp_path))
+    monkeypatch.setenv('MARA_NO_SERVER', '1')
+
+    process = subprocess.run([sys.executable, '-c', 'from mara_base.server import main; main()',
+                              'run-many', '--concurrency', '2', '--log-directory', 'logs', '--file', 'commands.txt',
+                              'first: batch_app.touch first'],
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+    assert 1 == process.returncode, process.stdout
+    pids = {(tmp_path / name).read_text() for name in ('first', 'second')}
+    assert 2 == len(pids)
+    assert not (tmp_path / 'skipped').exists()
+    assert 'touched second' in (tmp_path / 'logs' / 'second.log').read_text()
+    assert 'exit 3' in process.stdout and 'skipped' in process.stdout
+    assert 'Wall time' in process.stdout
@@ -0,0 +1,91 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+def _mara(*args: str, **kwargs) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, '-c', 'from mara_base.server import main; main()', *args],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, **kwargs)
+
+
+@pytest.fixture()
+def app_directory(tmp_path, monkeypatch):
+    """An empty directory for an app in `tmp_path`, with its own cache"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    monkeypatch.setenv('PYTHONPATH', str(tmp_path))
+    monkeypatch.setenv('MARA_APP', 'not_existing_app')
+    return tmp_path
+
+
+def test_config_stats_of_the_startup(app_directory):
+    process = _mara('config-stats')
+
+    assert 0 == process.returncode, process.stderr
+    assert 'mara_base.log_queue ' in process.stderr
+
+
+COMMANDS = """
+import click
+
+from mara_base.config_system import replaceable
+
+
+@replaceable('lazy_app.commands.greeting')
+def greeting() -> str:
+    return 'default'
+
+
+@click.command()
+def greet():
+    "Prints the greeting"
+    print(greeting())
+"""
+
+CONTRIBUTIONS = """
+def MARA_CLICK_COMMANDS():
+    from . import commands
+    yield commands.greet
+"""
+
+APP = """
+import mara_base
+from mara_base.config_system import replace
+
+
+def compose_app():
+    from . import contributions
+    mara_base.register_all_in_module(contributions)
+    replace('lazy_app.commands.greeting', function=lambda: 'configured by compose_app')
+"""
+
+
+@pytest.fixture()
+def lazy_app(app_directory, monkeypatch):
+    """An app with lazy command loading whose compose_app() replaces a config function"""
+    (app_directory / 'lazy_app').mkdir()
+    (app_directory / 'lazy_app' / '__init__.py').write_text(APP)
+    (app_directory / 'lazy_app' / 'contributions.py').write_text(CONTRIBUTIONS)
+    (app_directory / 'lazy_app' / 'commands.py').write_text(COMMANDS)
+    monkeypatch.setenv('MARA_APP', 'lazy_app')
+    monkeypatch.setenv('MARA_NO_SERVER', '1')
+    monkeypatch.setenv('MARA_MARA_BASE__LAZY_COMMAND_LOADING', 'true')
+    return app_directory
+
+
+def test_command_from_manifest_sees_replacements_of_compose_app(lazy_app):
+    for _ in range(2):
+        process = _mara('lazy_app.greet')
+        assert 0 == process.returncode, process.stderr
+        assert 'configured by compose_app' == process.stdout.strip().splitlines()[-1]
+    assert list((lazy_app / 'cache').rglob('commands-*.json'))
+
+
+def test_manifest_is_outdated_when_contributing_module_changes(lazy_app):
+    assert 'lazy_app.greet' in _mara('--help').stdout
+    contributions = lazy_app / 'lazy_app' / 'contributions.py'
+    contributions.write_text(CONTRIBUTIONS.replace('yield commands.greet', 'yield from ()'))
+    os.utime(contributions, (os.path.getmtime(contributions) + 10,) * 2)
+    assert 'lazy_app.greet' not in _mara('--help').stdout
@@ -0,0 +1,52 @@
+import logging
+import threading
+
+import pytest
+
+from mara_base import log_queue
+
+
+class _SlowHandler(logging.Handler):
+    """Collects messages, blocks until released"""
+
+    def __init__(self):
+        super().__init__()
+        self.released = threading.Event()
+        self.messages = []
+
+    def emit(self, record):
+        self.released.wait()
+        self.messages.append(record.getMessage())
+
+
+@pytest.fixture()
+def handler():
+    handler = _SlowHandler()
+    root_handlers = list(logging.root.handlers)
+    for root_handler in root_handlers:
+        logging.root.removeHandler(root_handler)
+    logging.root.addHandler(handler)
+    yield handler
+    handler.released.set()
+    log_queue.stop()
+    logging.root.removeHandler(handler)
+    for root_handler in root_handlers:
+        logging.root.addHandler(root_handler)
+
+
+def test_drops_records_when_full_and_flushes_on_stop(handler):
+    log_queue.start(capacity=2, overflow='drop')
+    logger = logging.getLogger('test_log_queue')
+    for i in range(10):
+        logger.warning('message %s', i)
+
+    # the listener holds at most one record, the queue two more
+    dropped = log_queue.dropped_records()
+    assert dropped >= 7
+    handler.released.set()
+    log_queue.stop()
+
+    assert handler in logging.root.handlers
+    assert 'message 0' == handler.messages[0]
+    assert 10 - dropped + 1 == len(handler.messages)
+    assert f'Dropped {dropped} log records' in handler.messages[-1]
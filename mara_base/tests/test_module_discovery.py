@@ -0,0 +1,52 @@
+import sys
+
+import pytest
+
+from mara_base import module_discovery
+
+
+@pytest.fixture()
+def app_dir(tmp_path, monkeypatch):
+    """An app package `discovered_app.app` in sys.path and an empty discovery cache"""
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    monkeypatch.setattr(module_discovery, '_cache', None)
+    package = tmp_path / 'path' / 'discovered_app'
+    package.mkdir(parents=True)
+    (package / '__init__.py').write_text("raise RuntimeError('must not be imported')\n")
+    (package / 'app.py').write_text('')
+    monkeypatch.syspath_prepend(str(tmp_path / 'path'))
+    yield package
+
+
+def test_find_local_setup_without_importing(app_dir):
+    assert module_discovery.find_local_setup('discovered_app.app') is None
+    assert module_discovery.module_exists('discovered_app.app')
+    assert 'discovered_app' not in sys.modules
+
+    (app_dir / 'local_setup.py').write_text('')
+    assert 'discovered_app.local_setup' == module_discovery.find_local_setup('discovered_app.app')
+
+
+def test_lookups_are_cached(app_dir, monkeypatch):
+    assert module_discovery.find_local_setup('discovered_app.app') is None
+
+    # a new process reads the lookups from the cache file
+    monkeypatch.setattr(module_discovery, '_cache', None)
+    monkeypatch.setattr(module_discovery, '_find_spec', None)
+    assert module_discovery.find_local_setup('discovered_app.app') is None
+
+
+def test_lookups_depend_on_the_current_directory(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    monkeypatch.setattr(module_discovery, '_cache', None)
+    monkeypatch.syspath_prepend('')
+    for project in ('a', 'b'):
+        (tmp_path / project / 'cwd_app').mkdir(parents=True)
+        (tmp_path / project / 'cwd_app' / 'app.py').write_text('')
+    (tmp_path / 'a' / 'cwd_app' / 'local_setup.py').write_text('')
+
+    monkeypatch.chdir(tmp_path / 'a')
+    assert 'cwd_app.local_setup' == module_discovery.find_local_setup('cwd_app.app')
+    monkeypatch.chdir(tmp_path / 'b')
+    assert module_discovery.find_local_setup('cwd_app.app') is None
+    assert module_discovery.module_exists('cwd_app.app')
@@ -0,0 +1,75 @@
+import sys
+import types
+
+import pytest
+
+from mara_base import monkey_patch
+
+
+@pytest.fixture()
+def module():
+    """A module with a function to patch"""
+    module = types.ModuleType('patched_module')
+    exec('def add(x):\n    "Adds one"\n    return x + 1\n', module.__dict__)
+    sys.modules['patched_module'] = module
+    yield module
+    del sys.modules['patched_module']
+    monkey_patch.PATCH_STACKS.pop('patched_module.add', None)
+    monkey_patch.REPLACED_FUNCTIONS.pop('patched_module.add', None)
+
+
+def test_wrap_stack(module):
+    original = module.add
+
+    def times_two(original_function, x):
+        return original_function(x) * 2
+
+    def plus_ten(original_function, x):
+        return original_function(x) + 10
+
+    monkey_patch.wrap(module.add)(times_two)
+    monkey_patch.wrap(module.add)(plus_ten)
+
+    assert 14 == module.add(1)
+    assert 'Adds one' == module.add.__doc__
+    assert f'{__name__}.plus_ten' == monkey_patch.REPLACED_FUNCTIONS['patched_module.add']
+
+    monkey_patch.unwrap(module.add, times_two)
+    assert 12 == module.add(1)
+
+    monkey_patch.unwrap(module.add)
+    assert module.add is original
+    assert 'patched_module.add' not in monkey_patch.REPLACED_FUNCTIONS
+
+
+def test_patch_replaces_previous_wraps(module):
+    @monkey_patch.wrap(module.add)
+    def times_two(original_function, x):
+        return original_function(x) * 2
+
+    @monkey_patch.patch(module.add)
+    def subtract(x):
+        return x - 1
+
+    assert 0 == module.add(1)
+
+    monkey_patch.unpatch(module.add, subtract)
+    assert 4 == module.add(1)
+    assert module.add is monkey_patch.PATCH_STACKS['patched_module.add'].dispatcher
+
+
+def test_patch_is_installed_without_dispatcher(module):
+    @monkey_patch.patch(module.add)
+    def subtract(x):
+        return x - 1
+
+    assert module.add is subtract
+    assert 0 == module.add(1)
+
+    def times_two(original_function, x):
+        return original_function(x) * 2
+
+    monkey_patch.wrap(module.add)(times_two)
+    assert 0 == module.add(1)
+    monkey_patch.unwrap(module.add, times_two)
+    assert module.add is subtract
@@ -0,0 +1,131 @@
+import sys
+import types
+
+import pytest
+
+import mara_base
+import mara_base.module_discovery
+
+
+@pytest.fixture(autouse=True)
+def clean_registry(monkeypatch):
+    """Use an empty registry in each test"""
+    monkeypatch.setattr(mara_base, '_mara_configuration', mara_base.collections.defaultdict(list))
+    monkeypatch.setattr(mara_base, '_registered_modules', {})
+    monkeypatch.setattr(mara_base, '_registered_items', set())
+    monkeypatch.setattr(mara_base, '_materialized', {})
+    yield
+    if mara_base._registering_finder in sys.meta_path:
+        sys.meta_path.remove(mara_base._registering_finder)
+
+
+def _module(name: str, **attrs) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    return module
+
+
+def test_register_all_in_module_is_idempotent():
+    module = _module('contributing', MARA_THINGS=['a', 'b'])
+    mara_base.register_all_in_module(module)
+    mara_base.register_all_in_module(module)
+
+    assert ((module, 'a'), (module, 'b')) == tuple(mara_base.get_flattend_configuration('MARA_THINGS'))
+
+
+def test_overlay_undoes_registrations():
+    module = _module('contributing', MARA_THINGS=['a'])
+    with mara_base.overlay():
+        mara_base.register_all_in_module(module)
+        assert ((module, 'a'),) == tuple(mara_base.get_flattend_configuration('MARA_THINGS'))
+    assert () == tuple(mara_base.get_flattend_configuration('MARA_THINGS'))
+
+    mara_base.register_all_in_module(module)
+    assert ((module, 'a'),) == tuple(mara_base.get_flattend_configuration('MARA_THINGS'))
+
+
+def test_register_modules_on_import(tmp_path, monkeypatch):
+    (tmp_path / 'contributing_on_import.py').write_text("MARA_THINGS = ['a']\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    mara_base.register_modules_on_import()
+
+    import contributing_on_import
+    assert contributing_on_import.__loader__.__class__.__name__ != '_RegisteringLoader'
+    assert ((contributing_on_import, 'a'),) == tuple(mara_base.get_flattend_configuration('MARA_THINGS'))
+    del sys.modules['contributing_on_import']
+
+
+def test_contributions_are_materialized_until_registration():
+    calls = []
+
+    def MARA_THINGS():
+        calls.append(1)
+        yield 'a'
+
+    module = _module('contributing', MARA_THINGS=MARA_THINGS)
+    mara_base.register_all_in_module(module)
+
+    assert ((module, 'a'),) == mara_base.get_flattend_configuration('MARA_THINGS')
+    assert ((module, 'a'),) == mara_base.get_flattend_configuration('MARA_THINGS')
+    assert 1 == len(calls)
+
+    other_module = _module('other', MARA_THINGS=['b'])
+    mara_base.register_all_in_module(other_module)
+    assert ((module, 'a'), (other_module, 'b')) == mara_base.get_flattend_configuration('MARA_THINGS')
+    assert 2 == len(calls)
+
+
+def test_dynamic_contributions_are_evaluated_on_every_call():
+    values = iter(['a', 'b'])
+
+    @mara_base.dynamic
+    def MARA_THINGS():
+        yield next(values)
+
+    module = _module('contributing', MARA_THINGS=MARA_THINGS)
+    mara_base.register_all_in_module(module)
+
+    assert ((module, 'a'),) == mara_base.get_flattend_configuration('MARA_THINGS')
+    assert ((module, 'b'),) == mara_base.get_flattend_configuration('MARA_THINGS')
+
+
+def test_contributions_from_entry_points(tmp_path, monkeypatch):
+    (tmp_path / 'contributing_via_metadata.py').write_text(
+        "MARA_THINGS = ['a']\nMARA_OTHER_THINGS = ['b']\n")
+    (tmp_path / 'not_contributing.py').write_text("raise Exception('should not be imported')\n")
+    dist_info = tmp_path / 'contributing_via_metadata-1.0.dist-info'
+    dist_info.mkdir()
+    (dist_info / 'METADATA').write_text('Name: contributing-via-metadata\nVersion: 1.0\n')
+    (dist_info / 'entry_points.txt').write_text(
+        '[mara.MARA_THINGS]\ncontributing_via_metadata = contributing_via_metadata:MARA_THINGS\n\n'
+        '[mara.MARA_UNUSED_THINGS]\nnot_contributing = not_contributing:MARA_UNUSED_THINGS\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    monkeypatch.setattr(mara_base.module_discovery, '_cache', None)
+    monkeypatch.setattr(mara_base, '_entry_points', None)
+    monkeypatch.setattr(mara_base, '_loaded_entry_point_groups', set())
+
+    assert ['a'] == [item for _, item in mara_base.get_flattend_configuration('MARA_THINGS')]
+    assert 'not_contributing' not in sys.modules
+
+    # registering the module explicitly doesn't contribute its items twice
+    import contributing_via_metadata
+    mara_base.register_all_in_module(contributing_via_metadata)
+    assert ['a'] == [item for _, item in mara_base.get_flattend_configuration('MARA_THINGS')]
+    assert ['b'] == [item for _, item in mara_base.get_flattend_configuration('MARA_OTHER_THINGS')]
+
+
+def test_entry_points_are_cached(tmp_path, monkeypatch):
+    from mara_base import module_discovery
+    dist_info = tmp_path / 'cached_metadata-1.0.dist-info'
+    dist_info.mkdir()
+    (dist_info / 'METADATA').write_text('Name: cached-metadata\nVersion: 1.0\n')
+    (dist_info / 'entry_points.txt').write_text('[mara.MARA_THINGS]\na = a:MARA_THINGS\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    monkeypatch.setattr(module_discovery, '_cache', None)
+
+    assert {'mara.MARA_THINGS': [('a', 'a:MARA_THINGS')]} == module_discovery.find_entry_points('mara.')
+    monkeypatch.setattr(module_discovery, '_cache', None)
+    monkeypatch.setattr(module_discovery.importlib.metadata, 'distributions', lambda: pytest.fail('not cached'))
+    assert {'mara.MARA_THINGS': [('a', 'a:MARA_THINGS')]} == module_discovery.find_entry_points('mara.')
@@ -0,0 +1,84 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from mara_base import server
+
+COMMANDS = """
+import os
+
+import click
+
+
+@click.command()
+@click.argument('path')
+def touch(path):
+    "Writes the pid of the process running the command"
+    with open(path, 'w') as f:
+        f.write(str(os.getpid()))
+"""
+
+APP = """
+import mara_base
+
+
+def MARA_CLICK_COMMANDS():
+    from . import commands
+    yield commands.touch
+
+
+def compose_app():
+    import served_app
+    mara_base.register_all_in_module(served_app)
+"""
+
+
+@pytest.fixture()
+def running_server(tmp_path, monkeypatch):
+    """A `mara serve` process for an app in `tmp_path`"""
+    (tmp_path / 'served_app').mkdir()
+    (tmp_path / 'served_app' / '__init__.py').write_text(APP)
+    (tmp_path / 'served_app' / 'commands.py').write_text(COMMANDS)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    monkeypatch.setenv('MARA_APP', 'served_app')
+    monkeypatch.setenv('PYTHONPATH', str(tmp_path))
+    process = subprocess.Popen([sys.executable, '-c', 'from mara_base.server import main; main()', 'serve'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        if os.path.exists(server.socket_path()):
+            break
+        time.sleep(0.05)
+    yield process
+    process.terminate()
+    process.wait()
+
+
+def test_run_in_server(running_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(sys, 'stdin', open(os.devnull))
+    assert 0 == server.run_in_server(['served_app.touch', str(tmp_path / 'pid')])
+    pid = int((tmp_path / 'pid').read_text())
+    assert pid not in (os.getpid(), running_server.pid)
+
+    assert 2 == server.run_in_server(['no-such-command'])
+
+
+def test_terminated_server_removes_its_socket(running_server):
+    assert os.path.exists(server.socket_path())
+    running_server.terminate()
+    running_server.wait(timeout=5)
+    assert not os.path.exists(server.socket_path())
+
+
+def test_subcommand():
+    assert 'config-stats' == server._subcommand(['--debug', 'config-stats', 'print-config'])
+    assert 'run-many' == server._subcommand(['run-many', 'serve', 'config-stats'])
+    assert server._subcommand(['--profile-startup']) is None
+
+
+def test_run_in_server_without_server(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    assert server.run_in_server(['print-config']) is None
@@ -0,0 +1,48 @@
+import io
+import json
+import time
+
+import pytest
+
+from mara_base import startup_profiler
+
+
+@pytest.fixture(autouse=True)
+def profiler(monkeypatch):
+    """An enabled profiler without recorded phases"""
+    monkeypatch.setattr(startup_profiler, 'enabled', True)
+    monkeypatch.setattr(startup_profiler, '_events', [])
+    monkeypatch.setattr(startup_profiler, '_totals', startup_profiler.collections.defaultdict(lambda: [0, 0]))
+
+
+def test_trace_and_summary(tmp_path):
+    with startup_profiler.phase('fast', module='a'):
+        pass
+    with startup_profiler.phase('slow'):
+        time.sleep(0.01)
+    assert [1, 2] == list(startup_profiler.profiled_items('items', [1, 2]))
+
+    path = tmp_path / 'trace.json'
+    startup_profiler.write_trace(str(path))
+    events = json.loads(path.read_text())['traceEvents']
+    assert ['fast', 'slow', 'items', 'items', 'items'] == [event['name'] for event in events]
+    assert all(event['ph'] == 'X' for event in events)
+    assert {'module': 'a'} == events[0]['args']
+    assert 'contributions' == events[2]['cat']
+    assert events[1]['dur'] >= 10000
+
+    summary = io.StringIO()
+    startup_profiler.print_summary(summary)
+    lines = summary.getvalue().splitlines()
+    assert 'slow' == lines[0].split()[0]
+    assert {'slow', 'fast', 'items'} == {line.split()[0] for line in lines}
+    durations = [float(line.split()[1]) for line in lines]
+    assert sorted(durations, reverse=True) == durations
+    assert any(line.startswith('items') and line.endswith('(3x)') for line in lines)
+
+
+def test_disabled_profiler_records_nothing(monkeypatch):
+    monkeypatch.setattr(startup_profiler, 'enabled', False)
+    with startup_profiler.phase('ignored'):
+        pass
+    assert [] == startup_profiler._events
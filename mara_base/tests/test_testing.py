@@ -0,0 +1,39 @@
+import types
+
+import mara_base
+from mara_base import monkey_patch
+from mara_base.config_system import replace, replaceable
+from mara_base.testing import overlay
+
+
+def patched_function():
+    return 'original'
+
+
+def test_overlay():
+    @replaceable('test.overlaid')
+    def overlaid() -> str:
+        return 'original'
+
+    module = types.ModuleType('contributing_in_overlay')
+    module.MARA_OVERLAID_THINGS = ['a']
+    contributions = len(mara_base.get_flattend_configuration('MARA_OVERLAID_THINGS'))
+
+    with overlay():
+        replace('test.overlaid', function=lambda: 'replaced')
+        mara_base.register_all_in_module(module)
+        monkey_patch.patch(patched_function)(lambda: 'patched')
+
+        assert 'replaced' == overlaid()
+        assert contributions + 1 == len(mara_base.get_flattend_configuration('MARA_OVERLAID_THINGS'))
+        assert 'patched' == globals()['patched_function']()
+
+    assert 'original' == overlaid()
+    assert contributions == len(mara_base.get_flattend_configuration('MARA_OVERLAID_THINGS'))
+    assert 'original' == globals()['patched_function']()
+    assert f'{__name__}.patched_function' not in monkey_patch.REPLACED_FUNCTIONS
+
+    # the module can be registered again
+    with overlay():
+        mara_base.register_all_in_module(module)
+        assert contributions + 1 == len(mara_base.get_flattend_configuration('MARA_OVERLAID_THINGS'))
@@ -23,7 +23,7 @@ setup(
 
     entry_points={
         'console_scripts': [
-            'mara = mara_base.cli:main',
+            'mara = mara_base.server:main',
         ],
     },
 